@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from instrumentation import StageRecorder
+from pipeline import run_pipeline
+from plot_json import GENE_MODALITIES, MODALITY_KEYS, extract_contact_series, extract_series
+from synthetic_data import SCALES, generate_dataset
+
+REPORT_PATH = 'reports/benchmark_runs.jsonl'
+
+def extract_all_series(json_dir, samples):
+    """Pull every plottable series of every cell out of the alive JSONs, as the plot menus would"""
+    n_series = 0
+    for sample_num in samples:
+        with open(os.path.join(json_dir, f'sample_{sample_num}_alive.json'), 'r') as f:
+            data = json.load(f)
+        for cell_data in data.values():
+            genes = {'proteins': set(), 'promoters': set()}
+            for entry in cell_data.values():
+                genes['proteins'].update(entry['proteins'])
+                genes['promoters'].update(entry['promoters'])
+            for modality in MODALITY_KEYS:
+                for gene_name in sorted(genes.get(GENE_MODALITIES.get(modality), [None])):
+                    extract_series(cell_data, modality, gene_name)
+                    n_series += 1
+            n_series += len(extract_contact_series(cell_data))
+    return n_series
+
+def run_benchmark(scale, workdir, recorder, seed=0, dtype='float64'):
+    params = SCALES[scale]
+    root = os.path.join(workdir, scale)
+    data_dir = os.path.join(root, 'data')
+    tensor_dir = os.path.join(root, 'tensor')
+    json_dir = os.path.join(root, 'json')
+    samples = list(range(1, params['n_samples'] + 1))
+
+    with recorder.stage('generate', scale=scale):
+        generate_dataset(root, seed=seed, **params)
+    with recorder.stage('pipeline', scale=scale):
+        run_pipeline(samples=samples, dtype=dtype, recorder=recorder, data_dir=data_dir, tensor_dir=tensor_dir,
+                     json_dir=json_dir, cache_dir=os.path.join(root, 'cache', 'inputs'))
+    with recorder.stage('plot_extract', scale=scale):
+        extract_all_series(json_dir, samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic data')
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium', 'large'], choices=sorted(SCALES))
+    parser.add_argument('--dtype', default='float64')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='keep generated data here instead of a temporary directory')
+    parser.add_argument('--report', default=REPORT_PATH, help='JSON lines file the run is appended to')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='cmos_benchmark_')
+    recorder = StageRecorder()
+    try:
+        for scale in args.scales:
+            print(f"\n=== {scale}: {SCALES[scale]} ===")
+            run_benchmark(scale, workdir, recorder, seed=args.seed, dtype=args.dtype)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print("\nBenchmark timings:")
+        print(recorder.summary())
+        recorder.write_report(args.report, argv=sys.argv[1:], scales={s: SCALES[s] for s in args.scales},
+                              dtype=args.dtype, seed=args.seed)
+        print(f"Report appended to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import json
+import os
+
+CATALOG_FILENAME = 'catalog.json'
+
+# JSON key of each tensor modality
+MODALITY_KEYS = {'Protein': 'proteins', 'Promoter': 'promoters'}
+
+def sample_catalog(tensor, mappings, sample_num, cell_lifecycles):
+    """Per cell: alive interval and the genes with non-NaN data in it, from the tensor's NaN mask"""
+    # Imported here so that reading the catalog (plot_json menus) does not pull in numpy
+    import numpy as np
+    times = np.array(sorted(mappings['time_to_idx']))
+    idx_to_feature = np.empty(len(mappings['feature_to_idx']), dtype=object)
+    for gene_name, feature_idx in mappings['feature_to_idx'].items():
+        idx_to_feature[feature_idx] = gene_name
+
+    sample_idx = mappings['sample_to_idx'].get(sample_num)
+    has_data = None
+    if sample_idx is not None:
+        has_data = ~np.isnan(tensor[sample_idx])  # (time, cell, modality, feature)
+
+    cells = {}
+    for cell, alive_times in cell_lifecycles.items():
+        birth, death = alive_times[0], alive_times[-1]
+        entry = {'alive': [int(birth), int(death)], 'proteins': [], 'promoters': []}
+        cell_idx = mappings['cell_to_idx'].get(cell)
+        if has_data is not None and cell_idx is not None:
+            lo = np.searchsorted(times, birth, side='left')
+            hi = np.searchsorted(times, death, side='right')
+            genes_present = has_data[lo:hi, cell_idx].any(axis=0)  # (modality, feature)
+            for modality, key in MODALITY_KEYS.items():
+                entry[key] = sorted(idx_to_feature[genes_present[mappings['modality_to_idx'][modality]]])
+        cells[cell] = entry
+    return {'cells': cells}
+
+def alive_json_path(json_dir, sample_num):
+    return os.path.join(json_dir, f'sample_{sample_num}_alive.json')
+
+def update_catalog(json_dir, sample_num, entry):
+    """Replace one sample's entry in the catalog, keeping the other samples. The entry records the
+    mtime of the sample's alive JSON so readers can tell when the JSON was rebuilt without it"""
+    entry['json_mtime'] = os.path.getmtime(alive_json_path(json_dir, sample_num))
+    catalog = load_catalog(json_dir) or {'samples': {}}
+    catalog['samples'][str(sample_num)] = entry
+    with open(os.path.join(json_dir, CATALOG_FILENAME), 'w') as f:
+        json.dump(catalog, f)
+
+def load_catalog(json_dir):
+    path = os.path.join(json_dir, CATALOG_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,192 @@
+import argparse
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import scipy.sparse as sparse
+except ImportError:  # CSR arrays are returned as plain numpy arrays instead
+    sparse = None
+
+CACHE_DIR = 'cache/contact_graph'
+
+def build_contact_graph(stat_path):
+    """Load a Stat.csv into per-time symmetric CSR adjacency arrays plus per-cell statistics.
+
+    Entries are stored sorted by (time, cell, neighbour), so the adjacency of time index ``t``
+    is the slice ``indptr[t * n_cells]:indptr[(t + 1) * n_cells]``.
+    """
+    stat_df = pd.read_csv(stat_path)
+    times = np.array([int(float(t)) for t in stat_df.columns[2:]])
+    cell1 = stat_df['cell1'].to_numpy(dtype=str)
+    cell2 = stat_df['cell2'].to_numpy(dtype=str)
+    cells = np.unique(np.concatenate([cell1, cell2]))
+    n_cells = len(cells)
+    n_times = len(times)
+
+    values = stat_df.iloc[:, 2:].to_numpy(dtype=np.float64)
+    pair_idx, time_idx = np.nonzero(values > 0)
+    i = np.searchsorted(cells, cell1[pair_idx])
+    j = np.searchsorted(cells, cell2[pair_idx])
+    area = values[pair_idx, time_idx]
+    not_self = i != j
+    i, j, time_idx, area = i[not_self], j[not_self], time_idx[not_self], area[not_self]
+
+    # Both directions of every contact; if a pair is listed twice the later row wins
+    rows = np.concatenate([i, j])[::-1]
+    cols = np.concatenate([j, i])[::-1]
+    t = np.concatenate([time_idx, time_idx])[::-1]
+    area = np.concatenate([area, area])[::-1]
+    keys = (t.astype(np.int64) * n_cells + rows) * n_cells + cols
+    keys, first = np.unique(keys, return_index=True)
+    rows, cols, t, area = rows[first], cols[first], t[first], area[first]
+
+    row_keys = t.astype(np.int64) * n_cells + rows
+    degree = np.bincount(row_keys, minlength=n_times * n_cells)
+    total_area = np.bincount(row_keys, weights=area, minlength=n_times * n_cells)
+    indptr = np.concatenate([[0], np.cumsum(degree)])
+
+    # Neighbour changes between consecutive time points: an edge at time t is new if
+    # it was absent at t - 1, and an edge at t - 1 is lost if it is absent at t
+    step = np.int64(n_cells) * n_cells
+    gained_mask = ~np.isin(keys, keys + step) & (t > 0)
+    lost_mask = ~np.isin(keys + step, keys) & (t < n_times - 1)
+    gained = np.bincount(row_keys[gained_mask], minlength=n_times * n_cells)
+    lost = np.bincount(row_keys[lost_mask] + n_cells, minlength=n_times * n_cells)
+
+    return {
+        'cells': cells,
+        'times': times,
+        'indptr': indptr,
+        'indices': cols,
+        'data': area,
+        'degree': degree.reshape(n_times, n_cells),
+        'total_area': total_area.reshape(n_times, n_cells),
+        'gained': gained.reshape(n_times, n_cells),
+        'lost': lost.reshape(n_times, n_cells),
+    }
+
+def load_contact_graph(sample_num, additional_dir='data/additional', cache_dir=CACHE_DIR):
+    """Contact graph of a sample, rebuilt only when its Stat.csv changed since it was cached"""
+    stat_path = f'{additional_dir}/WT_Sample{sample_num}/WT_Sample{sample_num}_Stat.csv'
+    # The resolved Stat path is part of the name so graphs of different datasets never share a file
+    key = hashlib.sha1(os.path.realpath(stat_path).encode('utf-8')).hexdigest()[:12]
+    cache_path = os.path.join(cache_dir, f'WT_Sample{sample_num}_contacts_{key}.npz')
+    stat = os.stat(stat_path)
+    source = np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if np.array_equal(cached['source'], source):
+                return {key: cached[key] for key in cached.files if key != 'source'}
+
+    graph = build_contact_graph(stat_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to a temporary file and renamed, so an interrupted run never leaves a truncated npz
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, source=source, **graph)
+    os.replace(tmp_path, cache_path)
+    return graph
+
+def cell_index(graph, cell):
+    idx = np.searchsorted(graph['cells'], cell)
+    if idx == len(graph['cells']) or graph['cells'][idx] != cell:
+        raise KeyError(f"Cell '{cell}' has no contacts in this sample")
+    return idx
+
+def time_index(graph, time):
+    idx = np.searchsorted(graph['times'], time)
+    if idx == len(graph['times']) or graph['times'][idx] != time:
+        raise KeyError(f"Time point {time} is not in this sample")
+    return idx
+
+def adjacency(graph, time):
+    """Contact area adjacency at a time point, as scipy CSR if available, else (data, indices, indptr)"""
+    n_cells = len(graph['cells'])
+    t = time_index(graph, time)
+    start, stop = graph['indptr'][t * n_cells], graph['indptr'][(t + 1) * n_cells]
+    indptr = graph['indptr'][t * n_cells:(t + 1) * n_cells + 1] - start
+    data = graph['data'][start:stop]
+    indices = graph['indices'][start:stop]
+    if sparse is None:
+        return data, indices, indptr
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_cells, n_cells))
+
+def cell_degree(graph, cell):
+    return graph['degree'][:, cell_index(graph, cell)]
+
+def cell_total_area(graph, cell):
+    return graph['total_area'][:, cell_index(graph, cell)]
+
+def cell_neighbour_changes(graph, cell):
+    """Number of neighbours gained and lost at each time point relative to the previous one"""
+    idx = cell_index(graph, cell)
+    return graph['gained'][:, idx], graph['lost'][:, idx]
+
+def contact_persistence(graph):
+    """Per contacting pair: number of time points in contact, first and last contact, and the
+    fraction of time points between first and last contact during which the pair touches"""
+    n_cells = len(graph['cells'])
+    row_keys = np.repeat(np.arange(len(graph['indptr']) - 1), np.diff(graph['indptr']))
+    t = row_keys // n_cells
+    rows = row_keys % n_cells
+    cols = graph['indices']
+    upper = rows < cols
+    pair_keys = rows[upper].astype(np.int64) * n_cells + cols[upper]
+    t = t[upper]
+
+    order = np.argsort(pair_keys, kind='stable')
+    pair_keys, t = pair_keys[order], t[order]
+    pairs, starts, counts = np.unique(pair_keys, return_index=True, return_counts=True)
+    first = t[starts]
+    last = t[starts + counts - 1]
+    return {
+        'cell1': graph['cells'][pairs // n_cells],
+        'cell2': graph['cells'][pairs % n_cells],
+        'n_times': counts,
+        'first_time': graph['times'][first],
+        'last_time': graph['times'][last],
+        'persistence': counts / (last - first + 1),
+    }
+
+def sample_summary(graph):
+    """Graph-level statistics per time point"""
+    present = graph['degree'] > 0
+    n_present = present.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'times': graph['times'],
+            'n_cells': n_present,
+            'n_contacts': graph['degree'].sum(axis=1) // 2,
+            'mean_degree': graph['degree'].sum(axis=1) / n_present,
+            'total_area': graph['total_area'].sum(axis=1) / 2,
+            'neighbour_changes': (graph['gained'] + graph['lost']).sum(axis=1) // 2,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Contact graph statistics from WT_Sample*_Stat.csv')
+    parser.add_argument('--samples', type=int, nargs='+', default=list(range(1, 9)))
+    parser.add_argument('--cell', help='print degree, contact area and neighbour changes of one cell')
+    args = parser.parse_args()
+
+    for sample_num in args.samples:
+        print(f"\nSample {sample_num}:")
+        graph = load_contact_graph(sample_num)
+        if args.cell:
+            degree = cell_degree(graph, args.cell)
+            area = cell_total_area(graph, args.cell)
+            gained, lost = cell_neighbour_changes(graph, args.cell)
+            for i in np.flatnonzero(degree):
+                print(f"  t={graph['times'][i]}: {degree[i]} neighbours, area {area[i]:.1f}, +{gained[i]}/-{lost[i]}")
+            continue
+        summary = sample_summary(graph)
+        persistence = contact_persistence(graph)
+        print(f"  {len(graph['cells'])} cells, {len(persistence['cell1'])} contacting pairs over {len(graph['times'])} time points")
+        print(f"  mean contacts per time point: {summary['n_contacts'].mean():.1f}")
+        print(f"  mean pair persistence: {persistence['persistence'].mean():.3f}")
+        print(f"  neighbour changes: {summary['neighbour_changes'].sum()}")
+
+if __name__ == "__main__":
+    main()
@@ -2,27 +2,40 @@ import pandas as pd
 import numpy as np
 import pickle
 import json
+import os
 from collections import defaultdict
+from instrumentation import stage
+from sample_inputs import CACHE_DIR, lifecycle_spans, load_sample_inputs
 
 # Load tensor and mappings
-print("Loading tensor and mappings...")
-tensor = np.load('tensor/tensor.npy', allow_pickle=True)
-with open('tensor/mappings.pkl', 'rb') as f:
-    mappings = pickle.load(f)
+def load_tensor(tensor_dir='tensor'):
+    print("Loading tensor and mappings...")
+    tensor = np.load(os.path.join(tensor_dir, 'tensor.npy'), allow_pickle=True)
+    with open(os.path.join(tensor_dir, 'mappings.pkl'), 'rb') as f:
+        mappings = pickle.load(f)
+    print(f"Tensor dtype: {tensor.dtype}")
+    return tensor, mappings
+
+# Reduced-precision tensors are written with their shortest round-trip repr, so a
+# float32/float16 0.1 shows up as 0.1 in the JSON rather than 0.10000000149011612
+def rate_to_float(rate):
+    if rate.dtype == np.float64:
+        return float(rate)
+    return float(str(rate))
 
 # Load cell ID to name mapping
-def load_name_dict():
-    df = pd.read_csv('data/additional/name_dictionary.csv', header=None)[1:]
+def load_name_dict(additional_dir='data/additional'):
+    df = pd.read_csv(f'{additional_dir}/name_dictionary.csv', header=None)[1:]
     return {str(row[0]): str(row[1]) for _, row in df.iterrows()}
 
 # Load lineage tree data
-def load_lineage_trees():
+def load_lineage_trees(additional_dir='data/additional'):
     # Load parent relationships
-    parent_df = pd.read_csv('data/additional/lineage_tree_parent.csv')
+    parent_df = pd.read_csv(f'{additional_dir}/lineage_tree_parent.csv')
     parent_dict = {str(row['child']): str(row['parent']) for _, row in parent_df.iterrows()}
     
     # Load children relationships
-    children_df = pd.read_csv('data/additional/lineage_tree_children.csv')
+    children_df = pd.read_csv(f'{additional_dir}/lineage_tree_children.csv')
     children_dict = {}
     for _, row in children_df.iterrows():
         parent = str(row['parent'])
@@ -33,8 +46,8 @@ def load_lineage_trees():
     return parent_dict, children_dict
 
 # Load cell fate data
-def load_cell_fate_data():
-    df = pd.read_csv('data/Cell Fate.csv')
+def load_cell_fate_data(cell_fate_path='data/Cell Fate.csv'):
+    df = pd.read_csv(cell_fate_path)
     cell_fate_dict = {}
     for _, row in df.iterrows():
         cell_name = str(row['Cell identity']).strip("'")  # Remove single quotes
@@ -46,177 +59,194 @@ def load_cell_fate_data():
         }
     return cell_fate_dict
 
-name_dict = load_name_dict()
-parent_dict, children_dict = load_lineage_trees()
-cell_fate_dict = load_cell_fate_data()
+def load_context(tensor_dir='tensor', additional_dir='data/additional', cell_fate_path='data/Cell Fate.csv'):
+    """Inputs shared by all samples, loaded once"""
+    tensor, mappings = load_tensor(tensor_dir)
+    parent_dict, children_dict = load_lineage_trees(additional_dir)
+    return {
+        'tensor': tensor,
+        'mappings': mappings,
+        'name_dict': load_name_dict(additional_dir),
+        'parent_dict': parent_dict,
+        'children_dict': children_dict,
+        'cell_fate_dict': load_cell_fate_data(cell_fate_path),
+    }
+
+def build_sample_json(sample_num, context, additional_dir='data/additional', json_dir='json', recorder=None,
+                      cache_dir=CACHE_DIR):
+    tensor = context['tensor']
+    mappings = context['mappings']
+    name_dict = context['name_dict']
+    parent_dict = context['parent_dict']
+    children_dict = context['children_dict']
+    cell_fate_dict = context['cell_fate_dict']
 
-for sample_num in range(1, 9):
     print(f"\nProcessing sample {sample_num}...")
+    with stage(recorder, 'json_unborn.read_inputs', sample=sample_num):
+        # 1. Load alive time points for each cell, together with the other per-sample
+        # inputs (read concurrently, or from the binary cache when the CSVs are unchanged)
+        inputs = load_sample_inputs(sample_num, additional_dir, cache_dir=cache_dir)
+        cell_lifecycles = {cell: list(range(birth, death + 1))
+                           for cell, (birth, death) in lifecycle_spans(inputs, name_dict).items()}
+
+        # 2. Surface and volume
+        surface_df = inputs['surface']
+        volume_df = inputs['volume']
     
-    # 1. Load alive time points for each cell
-    lifecycle_path = f'data/additional/WT_Sample{sample_num}/WT_Sample{sample_num}_lifescycle.csv'
-    cell_lifecycles = {}
-    with open(lifecycle_path, 'r') as f:
-        for line in f:
-            # Remove whitespace and split by comma
-            parts = line.split(',')
-            if not parts or not parts[0]:
-                continue
-            cell_id = str(parts[0])
-            cell_name = name_dict.get(cell_id, cell_id)
-            alive_times = [int(x) for x in parts[1:] if x]
-            if alive_times:
-                cell_lifecycles[cell_name] = list(range(alive_times[0], alive_times[-1] + 1))
-
-    # 2. Load surface and volume
-    surface_path = f'data/additional/WT_Sample{sample_num}/WT_Sample{sample_num}_surface.csv'
-    volume_path = f'data/additional/WT_Sample{sample_num}/WT_Sample{sample_num}_volume.csv'
-    surface_df = pd.read_csv(surface_path, index_col=0)
-    volume_df = pd.read_csv(volume_path, index_col=0)
-    
-    # Get all time points from the data (they should be the same across files)
-    sample_time_points = [int(t) for t in surface_df.index]
-    sample_time_points.sort()
-    print(f"Sample {sample_num} has time points: {sample_time_points}")
-
-    # 4. Load contact area (Stat)
-    stat_path = f'data/additional/WT_Sample{sample_num}/WT_Sample{sample_num}_Stat.csv'
-    stat_df = pd.read_csv(stat_path)
-    stat_time_points = [str(tp) for tp in stat_df.columns[2:]]
-
-    # Preprocess Stat for fast lookup
-    cell_time_to_neighbors = defaultdict(dict)
-    for _, row in stat_df.iterrows():
-        c1, c2 = str(row['cell1']), str(row['cell2'])
-        for t_str in stat_time_points:
-            val = row.get(t_str, None)
-            if pd.notna(val) and val > 0:
-                cell_time_to_neighbors[(c1, t_str)][c2] = float(val)
-                cell_time_to_neighbors[(c2, t_str)][c1] = float(val)
-
-    # 5. Get all cells that appear in this sample
-    all_cells = set()
-    # Add cells from lifecycle data
-    all_cells.update(cell_lifecycles.keys())
-    # Add cells from surface data
-    all_cells.update(surface_df.columns)
-    # Add cells from volume data
-    all_cells.update(volume_df.columns)
-    # Add cells from stat data
-    for _, row in stat_df.iterrows():
-        all_cells.add(str(row['cell1']))
-        all_cells.add(str(row['cell2']))
-
-    # 6. Build the output structure
-    output = {}
-    sorted_cells = sorted(all_cells)
-    for cell in sorted_cells:
-        output[cell] = {}
+        # Get all time points from the data (they should be the same across files)
+        sample_time_points = [int(t) for t in surface_df.index]
+        sample_time_points.sort()
+        print(f"Sample {sample_num} has time points: {sample_time_points}")
+
+        # 4. Contact area (Stat)
+        stat_df = inputs['stat']
+        stat_time_points = [str(tp) for tp in stat_df.columns[2:]]
+
+    with stage(recorder, 'json_unborn.stat_index', sample=sample_num):
+        # Preprocess Stat for fast lookup
+        cell_time_to_neighbors = defaultdict(dict)
+        for _, row in stat_df.iterrows():
+            c1, c2 = str(row['cell1']), str(row['cell2'])
+            for t_str in stat_time_points:
+                val = row.get(t_str, None)
+                if pd.notna(val) and val > 0:
+                    cell_time_to_neighbors[(c1, t_str)][c2] = float(val)
+                    cell_time_to_neighbors[(c2, t_str)][c1] = float(val)
+
+    with stage(recorder, 'json_unborn.build_cells', sample=sample_num):
+        # 5. Get all cells that appear in this sample
+        all_cells = set()
+        # Add cells from lifecycle data
+        all_cells.update(cell_lifecycles.keys())
+        # Add cells from surface data
+        all_cells.update(surface_df.columns)
+        # Add cells from volume data
+        all_cells.update(volume_df.columns)
+        # Add cells from stat data
+        for _, row in stat_df.iterrows():
+            all_cells.add(str(row['cell1']))
+            all_cells.add(str(row['cell2']))
+
+        # 6. Build the output structure
+        output = {}
+        sorted_cells = sorted(all_cells)
+        for cell in sorted_cells:
+            output[cell] = {}
         
-        # Get parent and children for this cell
-        parent = parent_dict.get(cell, None)
-        potential_children = children_dict.get(cell, [])
+            # Get parent and children for this cell
+            parent = parent_dict.get(cell, None)
+            potential_children = children_dict.get(cell, [])
         
-        # Get birth and death times for this cell
-        birth_time = None
-        death_time = None
-        if cell in cell_lifecycles:
-            birth_time = cell_lifecycles[cell][0]
-            death_time = cell_lifecycles[cell][-1]
+            # Get birth and death times for this cell
+            birth_time = None
+            death_time = None
+            if cell in cell_lifecycles:
+                birth_time = cell_lifecycles[cell][0]
+                death_time = cell_lifecycles[cell][-1]
         
-        for t in sample_time_points:
-            t_str = str(t)
+            for t in sample_time_points:
+                t_str = str(t)
             
-            # Filter children to only include those that have been born by this time point
-            # (even if they are now dead or divided)
-            born_children = []
-            for child in potential_children:
-                if child in cell_lifecycles and cell_lifecycles[child][0] <= t:
-                    born_children.append(child)
+                # Filter children to only include those that have been born by this time point
+                # (even if they are now dead or divided)
+                born_children = []
+                for child in potential_children:
+                    if child in cell_lifecycles and cell_lifecycles[child][0] <= t:
+                        born_children.append(child)
             
-            # Determine lifecycle state
-            if birth_time is None or t < birth_time:
-                lifecycle = "unborn"
-                age = None
-                surface = None
-                volume = None
-                neighbours = []
-                contacting_area = {}
-                proteins = {}
-                promoters = {}
-            elif t <= death_time:
-                # Cell is alive
-                lifecycle = "alive"
-                age = int(t - birth_time)
+                # Determine lifecycle state
+                if birth_time is None or t < birth_time:
+                    lifecycle = "unborn"
+                    age = None
+                    surface = None
+                    volume = None
+                    neighbours = []
+                    contacting_area = {}
+                    proteins = {}
+                    promoters = {}
+                elif t <= death_time:
+                    # Cell is alive
+                    lifecycle = "alive"
+                    age = int(t - birth_time)
                 
-                # Surface and volume
-                surface = None
-                volume = None
-                if cell in surface_df.columns and t in surface_df.index:
-                    val = surface_df.at[t, cell]
-                    surface = float(val) if pd.notna(val) else None
-                if cell in volume_df.columns and t in volume_df.index:
-                    val = volume_df.at[t, cell]
-                    volume = float(val) if pd.notna(val) else None
-
-                # Neighbours and contacting area
-                contacting_area = cell_time_to_neighbors.get((cell, t_str), {})
-                neighbours = list(contacting_area.keys())
-
-                # Gene expression
-                proteins = {}
-                promoters = {}
-                for gene_name, feature_idx in mappings['feature_to_idx'].items():
-                    for modality, modality_idx in mappings['modality_to_idx'].items():
-                        try:
-                            sample_idx = mappings['sample_to_idx'][sample_num]
-                            time_idx = mappings['time_to_idx'][t]
-                            cell_idx = mappings['cell_to_idx'][cell]
-                        except KeyError:
-                            continue
-                        rate = tensor[sample_idx, time_idx, cell_idx, modality_idx, feature_idx]
-                        if not np.isnan(rate):
-                            if modality == 'Protein':
-                                proteins[gene_name] = float(rate)
-                            elif modality == 'Promoter':
-                                promoters[gene_name] = float(rate)
-            else:
-                # Cell is dead or divided
-                if born_children:  # Has born children, so it divided
-                    lifecycle = "divided"
-                else:  # No born children, so it died
-                    lifecycle = "dead"
+                    # Surface and volume
+                    surface = None
+                    volume = None
+                    if cell in surface_df.columns and t in surface_df.index:
+                        val = surface_df.at[t, cell]
+                        surface = float(val) if pd.notna(val) else None
+                    if cell in volume_df.columns and t in volume_df.index:
+                        val = volume_df.at[t, cell]
+                        volume = float(val) if pd.notna(val) else None
+
+                    # Neighbours and contacting area
+                    contacting_area = cell_time_to_neighbors.get((cell, t_str), {})
+                    neighbours = list(contacting_area.keys())
+
+                    # Gene expression
+                    proteins = {}
+                    promoters = {}
+                    for gene_name, feature_idx in mappings['feature_to_idx'].items():
+                        for modality, modality_idx in mappings['modality_to_idx'].items():
+                            try:
+                                sample_idx = mappings['sample_to_idx'][sample_num]
+                                time_idx = mappings['time_to_idx'][t]
+                                cell_idx = mappings['cell_to_idx'][cell]
+                            except KeyError:
+                                continue
+                            rate = tensor[sample_idx, time_idx, cell_idx, modality_idx, feature_idx]
+                            if not np.isnan(rate):
+                                if modality == 'Protein':
+                                    proteins[gene_name] = rate_to_float(rate)
+                                elif modality == 'Promoter':
+                                    promoters[gene_name] = rate_to_float(rate)
+                else:
+                    # Cell is dead or divided
+                    if born_children:  # Has born children, so it divided
+                        lifecycle = "divided"
+                    else:  # No born children, so it died
+                        lifecycle = "dead"
                 
-                age = None
-                surface = None
-                volume = None
-                neighbours = []
-                contacting_area = {}
-                proteins = {}
-                promoters = {}
-
-            # Get cell lineage and fate information
-            cell_fate_info = cell_fate_dict.get(cell, {})
-            cell_lineage = cell_fate_info.get('cell_lineage', None)
-            cell_fate = cell_fate_info.get('cell_fate', None)
+                    age = None
+                    surface = None
+                    volume = None
+                    neighbours = []
+                    contacting_area = {}
+                    proteins = {}
+                    promoters = {}
+
+                # Get cell lineage and fate information
+                cell_fate_info = cell_fate_dict.get(cell, {})
+                cell_lineage = cell_fate_info.get('cell_lineage', None)
+                cell_fate = cell_fate_info.get('cell_fate', None)
             
-            output[cell][t_str] = {
-                "lifecycle": lifecycle,
-                "age": int(age) if age is not None else None,
-                "parent": parent,
-                "children": born_children,
-                "cell_lineage": cell_lineage,
-                "cell_fate": cell_fate,
-                "proteins": proteins,
-                "promoters": promoters,
-                "surface_area": float(surface) if surface is not None else None,
-                "volume": float(volume) if volume is not None else None,
-                "neighbours": neighbours,
-                "contacting_area": contacting_area
-            }
+                output[cell][t_str] = {
+                    "lifecycle": lifecycle,
+                    "age": int(age) if age is not None else None,
+                    "parent": parent,
+                    "children": born_children,
+                    "cell_lineage": cell_lineage,
+                    "cell_fate": cell_fate,
+                    "proteins": proteins,
+                    "promoters": promoters,
+                    "surface_area": float(surface) if surface is not None else None,
+                    "volume": float(volume) if volume is not None else None,
+                    "neighbours": neighbours,
+                    "contacting_area": contacting_area
+                }
 
     # 7. Save to file
-    out_path = f'json/sample_{sample_num}_unborn.json'
-    with open(out_path, 'w') as f:
-        json.dump(output, f, indent=4)
-    print(f"Saved {out_path}")
\ No newline at end of file
+    with stage(recorder, 'json_unborn.write_json', sample=sample_num):
+        out_path = f'{json_dir}/sample_{sample_num}_unborn.json'
+        with open(out_path, 'w') as f:
+            json.dump(output, f, indent=4)
+    print(f"Saved {out_path}")
+    return out_path
+
+def main():
+    context = load_context()
+    for sample_num in range(1, 9):
+        build_sample_json(sample_num, context)
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,26 @@ import pandas as pd
 import numpy as np
 import re
 import pickle
+import json
+import argparse
+from instrumentation import stage
+
+# Floating point types the tensor can be stored in; NaN marks missing values in all of them
+SUPPORTED_DTYPES = ('float64', 'float32', 'float16')
+
+FILENAME_PATTERN = r'WorkSpace_(\d+)_(\d+)_(\d+)_(\d+)\.csv'
+
+# Modality recorded by each construct number
+CONSTRUCT_MODALITIES = {1: 'Promoter', 2: 'Protein'}
 
 def parse_filename(filename):
-    match = re.match(r'WorkSpace_(\d+)_(\d+)_(\d+)_(\d+)\.csv', filename)
+    """(modality, sample) of a WorkSpace file, or None if the name or construct is not recognised"""
+    match = re.match(FILENAME_PATTERN, filename)
     if match:
         _, _, construct_num, sample_num = map(int, match.groups())
-        # Modality: 'Promoter' or 'Protein'
-        if construct_num == 1:
-            modality = 'Promoter'
-        elif construct_num == 2:
-            modality = 'Protein'
+        modality = CONSTRUCT_MODALITIES.get(construct_num)
+        if modality is None:
+            return None
         return modality, sample_num
     return None
 
@@ -29,13 +39,16 @@ def build_filename_to_gene_map(fileinfo_path):
             filename_to_gene[filename] = gene
     return filename_to_gene
 
-def create_tensor(data_dir, csv_files):
+def create_tensor(data_dir, csv_files, dtype='float64'):
+    if str(np.dtype(dtype)) not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported tensor dtype '{dtype}', choose from {SUPPORTED_DTYPES}")
+    dtype = np.dtype(dtype)
     features = set()
     cells = set()
     times = set()
     samples = set()
 
-    fileinfo_path = 'data/raw/FileInfo.txt'
+    fileinfo_path = os.path.join(data_dir, 'FileInfo.txt')
     filename_to_gene = build_filename_to_gene_map(fileinfo_path)
 
     for filename in csv_files:
@@ -66,7 +79,12 @@ def create_tensor(data_dir, csv_files):
         len(cells),
         2,
         len(features)
-    ), np.nan)
+    ), np.nan, dtype=dtype)
+
+    # Track how far the stored values drift from the float64 source values
+    max_abs_dev = 0.0
+    max_rel_dev = 0.0
+    n_values = 0
 
     for filename in csv_files:
         parsed = parse_filename(filename)
@@ -81,37 +99,77 @@ def create_tensor(data_dir, csv_files):
         df = pd.read_csv(os.path.join(data_dir, filename))
         df = df[df['Table4'].notna()]
         feature_idx = feature_to_idx[gene_name]
-        for _, row in df.iterrows():
-            cell = row['Table1']
-            time = row['Table2']
-            expression_rate = row['Table4']
-            cell_idx = cell_to_idx[cell]
-            time_idx = time_to_idx[time]
-            tensor[sample_idx, time_idx, cell_idx, modality_idx, feature_idx] = expression_rate
+        cell_idx = df['Table1'].map(cell_to_idx).to_numpy()
+        time_idx = df['Table2'].map(time_to_idx).to_numpy()
+        rates = df['Table4'].to_numpy(dtype=np.float64)
+        with np.errstate(over='ignore'):
+            stored = rates.astype(dtype)
+        # Values out of the dtype's range would become inf, which the JSON builders cannot write
+        overflow = np.isinf(stored) & np.isfinite(rates)
+        if overflow.any():
+            raise ValueError(f"{filename}: {int(overflow.sum())} rates (up to {np.abs(rates[overflow]).max():.6g}) "
+                             f"exceed the {dtype} range ({np.finfo(dtype).max:.6g}); use a wider --dtype")
+        tensor[sample_idx, time_idx, cell_idx, modality_idx, feature_idx] = stored
+
+        n_values += len(rates)
+        if len(rates):
+            abs_dev = np.abs(stored.astype(np.float64) - rates)
+            max_abs_dev = max(max_abs_dev, float(abs_dev.max()))
+            nonzero = rates != 0
+            if nonzero.any():
+                rel_dev = abs_dev[nonzero] / np.abs(rates[nonzero])
+                max_rel_dev = max(max_rel_dev, float(rel_dev.max()))
     return tensor, {
         'sample_to_idx': sample_to_idx,
         'time_to_idx': time_to_idx,
         'cell_to_idx': cell_to_idx,
         'modality_to_idx': modality_to_idx,
         'feature_to_idx': feature_to_idx,
-        'filename_to_gene': filename_to_gene
+        'filename_to_gene': filename_to_gene,
+        'dtype': str(dtype),
+        'dtype_report': {
+            'dtype': str(dtype),
+            'n_values': n_values,
+            'max_abs_deviation': max_abs_dev,
+            'max_rel_deviation': max_rel_dev,
+            'tensor_nbytes': int(tensor.nbytes),
+            'float64_nbytes': int(tensor.size * 8)
+        }
     }
 
-def main():
-    data_dir = 'data/raw'
-
+def build_tensor(data_dir='data/raw', tensor_dir='tensor', dtype='float64', recorder=None):
     csv_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
-    print("Creating tensor...")
-    tensor, mappings = create_tensor(data_dir, csv_files)
+    print(f"Creating tensor ({dtype})...")
+    with stage(recorder, 'tensor.create'):
+        tensor, mappings = create_tensor(data_dir, csv_files, dtype=dtype)
     print("Saving tensor and mappings...")
-    np.save('tensor/tensor.npy', tensor, allow_pickle=True)
-    with open('tensor/mappings.pkl', 'wb') as f:
-        pickle.dump(mappings, f)
+    with stage(recorder, 'tensor.save'):
+        os.makedirs(tensor_dir, exist_ok=True)
+        np.save(os.path.join(tensor_dir, 'tensor.npy'), tensor, allow_pickle=True)
+        with open(os.path.join(tensor_dir, 'mappings.pkl'), 'wb') as f:
+            pickle.dump(mappings, f)
+        with open(os.path.join(tensor_dir, 'dtype_report.json'), 'w') as f:
+            json.dump(mappings['dtype_report'], f, indent=4)
     print("Done!")
+    return tensor, mappings
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the expression tensor from raw data')
+    parser.add_argument('--dtype', default='float64', choices=SUPPORTED_DTYPES,
+                        help='floating point type of the saved tensor (NaN marks missing values)')
+    args = parser.parse_args()
+    tensor, mappings = build_tensor(dtype=args.dtype)
+
+    report = mappings['dtype_report']
+    print(f"\nValidation against float64 ({report['n_values']} values):")
+    print(f"  max absolute deviation: {report['max_abs_deviation']:.3g}")
+    print(f"  max relative deviation: {report['max_rel_deviation']:.3g}")
+    print(f"  tensor size: {report['tensor_nbytes'] / 1e6:.1f} MB (float64: {report['float64_nbytes'] / 1e6:.1f} MB)")
     print(f"\nTensor shape: {tensor.shape}")
     print("\nMappings:")
     for key, value in mappings.items():
-        print(f"{key}: {len(value)} unique values")
+        if isinstance(value, dict) and key != 'dtype_report':
+            print(f"{key}: {len(value)} unique values")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import pickle
+import numpy as np
+from catalog import MODALITY_KEYS
+from instrumentation import stage
+from sample_inputs import CACHE_DIR, load_sample_inputs, sample_paths
+
+DERIVED_DIR = 'derived'
+META_FILENAME = 'derived.json'
+DEFAULT_WINDOW = 5
+
+# Axes of each derived channel; all share the tensor's sample, time and cell axes
+CHANNELS = {
+    'surface': ('sample', 'time', 'cell'),
+    'volume': ('sample', 'time', 'cell'),
+    'surface_rate': ('sample', 'time', 'cell'),
+    'volume_rate': ('sample', 'time', 'cell'),
+    'expression_per_volume': ('sample', 'time', 'cell', 'modality', 'feature'),
+    'expression_smoothed': ('sample', 'time', 'cell', 'modality', 'feature'),
+}
+
+def time_derivative(values, times):
+    """Derivative along the first (time) axis for possibly uneven ``times``, NaN-aware.
+
+    Central differences where both neighbours are present, one-sided differences next to a NaN
+    gap or at the ends of the axis, and NaN wherever the value itself is missing.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    shape = (-1,) + (1,) * (values.ndim - 1)
+    result = np.full(values.shape, np.nan)
+    if len(times) < 2:
+        return result
+    step = np.diff(values, axis=0) / np.diff(times).reshape(shape)
+    forward = result.copy()
+    forward[:-1] = step
+    backward = result.copy()
+    backward[1:] = step
+    result[1:-1] = (values[2:] - values[:-2]) / (times[2:] - times[:-2]).reshape(shape)
+    result = np.where(np.isnan(result), forward, result)
+    result = np.where(np.isnan(result), backward, result)
+    result[np.isnan(values)] = np.nan
+    return result
+
+def check_window(window):
+    if window < 1 or window % 2 == 0:
+        raise ValueError(f"Smoothing window must be a positive odd number of time points, got {window}")
+
+def rolling_mean(values, window=DEFAULT_WINDOW):
+    """Centred mean over ``window`` time points along the first axis, ignoring NaNs.
+
+    Computed from cumulative sums of values and of non-NaN counts, so the cost does not depend on
+    the window. Missing points stay NaN: gaps (unborn, dead) are not filled in.
+    """
+    check_window(window)
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    zeros = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate([zeros, np.cumsum(np.where(missing, 0.0, values), axis=0)])
+    counts = np.concatenate([zeros, np.cumsum(~missing, axis=0)])
+    idx = np.arange(len(values))
+    lo = np.clip(idx - window // 2, 0, len(values))
+    hi = np.clip(idx + window // 2 + 1, 0, len(values))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (sums[hi] - sums[lo]) / (counts[hi] - counts[lo])
+    result[missing] = np.nan
+    return result
+
+def morphology_arrays(inputs, mappings):
+    """A sample's surface and volume tables as (time, cell) arrays on the tensor's axes"""
+    arrays = []
+    for key in ('surface', 'volume'):
+        df = inputs[key]
+        array = np.full((len(mappings['time_to_idx']), len(mappings['cell_to_idx'])), np.nan)
+        time_idx = np.array([mappings['time_to_idx'].get(int(t), -1) for t in df.index], dtype=np.int64)
+        cell_idx = np.array([mappings['cell_to_idx'].get(str(c), -1) for c in df.columns], dtype=np.int64)
+        rows = np.flatnonzero(time_idx >= 0)
+        cols = np.flatnonzero(cell_idx >= 0)
+        array[np.ix_(time_idx[rows], cell_idx[cols])] = df.to_numpy(dtype=np.float64)[np.ix_(rows, cols)]
+        arrays.append(array)
+    return arrays
+
+def source_signature(tensor_dir, additional_dir, samples):
+    """(mtime, size) of the tensor and of every sample's surface and volume CSVs"""
+    paths = [os.path.join(tensor_dir, 'tensor.npy'), os.path.join(tensor_dir, 'mappings.pkl')]
+    for sample_num in samples:
+        sample = sample_paths(sample_num, additional_dir)
+        paths += [sample['surface'], sample['volume']]
+    signature = {}
+    for path in paths:
+        stat = os.stat(path)
+        signature[path] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+def build_derived(tensor_dir='tensor', additional_dir='data/additional', window=DEFAULT_WINDOW, recorder=None,
+                  cache_dir=CACHE_DIR):
+    """Compute every derived channel, one sample at a time, into ``{tensor_dir}/derived/``.
+
+    Rates are per unit of the tensor's time labels; expression per volume is NaN where
+    the volume is missing or not positive. Channels are written to temporary files and moved into
+    place once all of them are complete; until then there is no ``derived.json``, so a failed build
+    is never taken for a current one.
+    """
+    check_window(window)
+    tensor = np.load(os.path.join(tensor_dir, 'tensor.npy'), mmap_mode='r')
+    with open(os.path.join(tensor_dir, 'mappings.pkl'), 'rb') as f:
+        mappings = pickle.load(f)
+    # At least float32: float16 cannot hold typical volumes
+    dtype = np.promote_types(tensor.dtype, np.float32)
+    times = np.array(sorted(mappings['time_to_idx'], key=mappings['time_to_idx'].get), dtype=np.float64)
+    samples = sorted(mappings['sample_to_idx'])
+
+    out_dir = os.path.join(tensor_dir, DERIVED_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META_FILENAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    channels = {}
+    for name, axes in CHANNELS.items():
+        shape = tensor.shape[:len(axes)]
+        channels[name] = np.lib.format.open_memmap(os.path.join(out_dir, f'{name}.npy.tmp'), mode='w+',
+                                                   dtype=dtype, shape=shape)
+
+    for sample_num in samples:
+        with stage(recorder, 'derived.sample', sample=sample_num):
+            s = mappings['sample_to_idx'][sample_num]
+            inputs = load_sample_inputs(sample_num, additional_dir, cache_dir=cache_dir)
+            surface, volume = morphology_arrays(inputs, mappings)
+            channels['surface'][s] = surface
+            channels['volume'][s] = volume
+            channels['surface_rate'][s] = time_derivative(surface, times)
+            channels['volume_rate'][s] = time_derivative(volume, times)
+
+            expression = np.asarray(tensor[s], dtype=np.float64)  # (time, cell, modality, feature)
+            volume = np.where(volume > 0, volume, np.nan)
+            channels['expression_per_volume'][s] = expression / volume[:, :, None, None]
+            channels['expression_smoothed'][s] = rolling_mean(expression, window)
+    for array in channels.values():
+        array.flush()
+    del channels, array
+    for name in CHANNELS:
+        os.replace(os.path.join(out_dir, f'{name}.npy.tmp'), os.path.join(out_dir, f'{name}.npy'))
+
+    meta = {
+        'window': window,
+        'dtype': str(dtype),
+        'channels': {name: list(axes) for name, axes in CHANNELS.items()},
+        'modalities': sorted(mappings['modality_to_idx'], key=mappings['modality_to_idx'].get),
+        'features': sorted(mappings['feature_to_idx'], key=mappings['feature_to_idx'].get),
+        'source': source_signature(tensor_dir, additional_dir, samples),
+    }
+    with open(f'{meta_path}.tmp', 'w') as f:
+        json.dump(meta, f, indent=4)
+    os.replace(f'{meta_path}.tmp', meta_path)
+    return meta
+
+def has_derived(tensor_dir='tensor'):
+    """Whether derived channels have been built in ``tensor_dir``"""
+    return os.path.exists(os.path.join(tensor_dir, DERIVED_DIR, META_FILENAME))
+
+def load_derived(tensor_dir='tensor', additional_dir='data/additional', window=None, rebuild=False,
+                 cache_dir=CACHE_DIR):
+    """Memory-mapped derived channels, rebuilt first if missing, stale or made with another window.
+    With ``window=None`` the window of the channels on disk is kept (DEFAULT_WINDOW if there are none)."""
+    meta_path = os.path.join(tensor_dir, DERIVED_DIR, META_FILENAME)
+    meta = None
+    if not rebuild and os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if window is None:
+            window = meta['window']
+        with open(os.path.join(tensor_dir, 'mappings.pkl'), 'rb') as f:
+            samples = sorted(pickle.load(f)['sample_to_idx'])
+        if meta['window'] != window or meta['source'] != source_signature(tensor_dir, additional_dir, samples):
+            meta = None
+    if meta is None:
+        print("Computing derived signals...")
+        window = DEFAULT_WINDOW if window is None else window
+        meta = build_derived(tensor_dir, additional_dir, window, cache_dir=cache_dir)
+    channels = {name: np.load(os.path.join(tensor_dir, DERIVED_DIR, f'{name}.npy'), mmap_mode='r')
+                for name in meta['channels']}
+    return {'meta': meta, 'channels': channels}
+
+# Channels are float32 unless the tensor is float64; write their shortest round-trip repr
+def _to_float(value):
+    if value.dtype == np.float64:
+        return float(value)
+    return float(str(value))
+
+def derived_values(derived, sample_idx, time_idx, cell_idx):
+    """Derived signals of one cell at one time point, laid out as in the alive JSON's "derived" entry"""
+    channels = derived['channels']
+    values = {}
+    for name in ('surface_rate', 'volume_rate'):
+        value = channels[name][sample_idx, time_idx, cell_idx]
+        values[name] = None if np.isnan(value) else _to_float(value)
+    for name, suffix in (('expression_per_volume', 'per_volume'), ('expression_smoothed', 'smoothed')):
+        block = channels[name][sample_idx, time_idx, cell_idx]  # (modality, feature)
+        for m, modality in enumerate(derived['meta']['modalities']):
+            present = np.flatnonzero(~np.isnan(block[m]))
+            values[f'{MODALITY_KEYS[modality]}_{suffix}'] = {derived['meta']['features'][i]: _to_float(block[m, i])
+                                                            for i in present}
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute derived signals (rates, per-volume and smoothed expression)')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='smoothing window in time points (odd)')
+    parser.add_argument('--tensor-dir', default='tensor')
+    args = parser.parse_args()
+    meta = build_derived(args.tensor_dir, window=args.window)
+    print(f"Saved {len(meta['channels'])} channels to {os.path.join(args.tensor_dir, DERIVED_DIR)}/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import json
+import os
+import platform
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+def read_peak_rss_kb():
+    """Peak resident set size of this process in kB (VmHWM, or ru_maxrss where /proc is missing)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter so the next reading covers only what follows.
+    Returns False where this is not supported, in which case peaks are process-lifetime peaks."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+class StageRecorder:
+    """Records wall time, CPU time and peak RSS of (possibly nested) pipeline stages"""
+
+    def __init__(self):
+        self.records = []
+        self._stack = []
+        self.started = datetime.now()
+
+    @contextmanager
+    def stage(self, name, **labels):
+        # A nested stage resets the peak counter, so fold the parent's peak so far into it first
+        if self._stack:
+            self._stack[-1]['peak_kb'] = max(self._stack[-1]['peak_kb'], read_peak_rss_kb())
+        resettable = reset_peak_rss()
+        entry = {'peak_kb': read_peak_rss_kb()}
+        # Appended on entry so the report lists parents before their nested stages
+        record = {'stage': name, **labels, 'depth': len(self._stack)}
+        self.records.append(record)
+        self._stack.append(entry)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            peak_kb = max(entry['peak_kb'], read_peak_rss_kb())
+            if self._stack:
+                self._stack[-1]['peak_kb'] = max(self._stack[-1]['peak_kb'], peak_kb)
+            record.update({
+                'wall_s': round(wall, 4),
+                'cpu_s': round(cpu, 4),
+                'peak_rss_mb': round(peak_kb / 1024, 1),
+                'peak_rss_per_stage': resettable,
+            })
+
+    def summary(self):
+        lines = []
+        for record in self.records:
+            labels = ''.join(f" {k}={v}" for k, v in record.items()
+                             if k not in ('stage', 'depth', 'wall_s', 'cpu_s', 'peak_rss_mb', 'peak_rss_per_stage'))
+            lines.append(f"{'  ' * record['depth']}{record['stage']}{labels}: "
+                         f"wall {record['wall_s']:.2f}s, cpu {record['cpu_s']:.2f}s, peak RSS {record['peak_rss_mb']:.1f} MB")
+        return '\n'.join(lines)
+
+    def write_report(self, path, **metadata):
+        """Append this run as one JSON line, so runs can be compared over time"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        run = {
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            **metadata,
+            'stages': self.records,
+        }
+        with open(path, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+
+def stage(recorder, name, **labels):
+    """Time a stage on ``recorder``, or do nothing when no recorder is given"""
+    if recorder is None:
+        return nullcontext()
+    return recorder.stage(name, **labels)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import pickle
+import numpy as np
+from create_json_alive import load_cell_fate_data, load_name_dict
+from sample_inputs import CACHE_DIR, lifecycle_spans, load_sample_inputs
+
+EXPORT_DIR = 'export'
+
+def encode_labels(cells, cell_fate_dict, key):
+    """Integer label per cell (-1 where unknown) and the label vocabulary"""
+    values = [cell_fate_dict.get(cell, {}).get(key) for cell in cells]
+    vocab = sorted({v for v in values if v is not None})
+    index = {v: i for i, v in enumerate(vocab)}
+    return np.array([index.get(v, -1) for v in values], dtype=np.int32), vocab
+
+def export_features(samples=None, tensor_dir='tensor', additional_dir='data/additional',
+                    cell_fate_path='data/Cell Fate.csv', export_dir=EXPORT_DIR, cache_dir=CACHE_DIR):
+    """Write per-sample (cell, time, feature) float32 arrays and (cell, time) presence masks as .npy.
+
+    All samples share the same cell, time and feature axes, described in ``meta.json``. Features
+    are the promoter rates, the protein rates (one per gene) and then surface area and volume.
+    """
+    tensor = np.load(os.path.join(tensor_dir, 'tensor.npy'), mmap_mode='r')
+    with open(os.path.join(tensor_dir, 'mappings.pkl'), 'rb') as f:
+        mappings = pickle.load(f)
+    if samples is None:
+        samples = sorted(mappings['sample_to_idx'])
+    name_dict = load_name_dict(additional_dir)
+    spans = {}
+    morphology = {}
+    for s in samples:
+        inputs = load_sample_inputs(s, additional_dir, cache_dir=cache_dir)
+        spans[s] = lifecycle_spans(inputs, name_dict)
+        morphology[s] = (inputs['surface'], inputs['volume'])
+
+    # Shared axes: every cell and time point seen in the tensor or in any exported sample
+    cells = set(mappings['cell_to_idx'])
+    times = set(mappings['time_to_idx'])
+    for s in samples:
+        cells.update(spans[s])
+        for df in morphology[s]:
+            cells.update(df.columns)
+            times.update(int(t) for t in df.index)
+    cells = np.array(sorted(cells, key=str), dtype=str)
+    times = np.array(sorted(times), dtype=np.int64)
+    n_genes = len(mappings['feature_to_idx'])
+    genes = sorted(mappings['feature_to_idx'], key=mappings['feature_to_idx'].get)
+    modalities = sorted(mappings['modality_to_idx'], key=mappings['modality_to_idx'].get)
+    feature_names = [f'{m}:{g}' for m in modalities for g in genes] + ['surface_area', 'volume']
+    n_expression = len(modalities) * n_genes
+
+    # Positions of the tensor's cell and time axes on the shared axes
+    tensor_cells = sorted(mappings['cell_to_idx'], key=mappings['cell_to_idx'].get)
+    tensor_times = sorted(mappings['time_to_idx'], key=mappings['time_to_idx'].get)
+    cell_pos = np.searchsorted(cells, np.array(tensor_cells, dtype=str))
+    time_pos = np.searchsorted(times, np.array(tensor_times, dtype=np.int64))
+
+    os.makedirs(export_dir, exist_ok=True)
+    cell_fate_dict = load_cell_fate_data(cell_fate_path)
+    lineage_labels, lineage_vocab = encode_labels(cells, cell_fate_dict, 'cell_lineage')
+    fate_labels, fate_vocab = encode_labels(cells, cell_fate_dict, 'cell_fate')
+    np.save(os.path.join(export_dir, 'lineage_labels.npy'), lineage_labels)
+    np.save(os.path.join(export_dir, 'fate_labels.npy'), fate_labels)
+
+    for s in samples:
+        print(f"Exporting sample {s}...")
+        sample_dir = os.path.join(export_dir, f'sample_{s}')
+        os.makedirs(sample_dir, exist_ok=True)
+        features = np.lib.format.open_memmap(os.path.join(sample_dir, 'features.npy'), mode='w+',
+                                             dtype=np.float32, shape=(len(cells), len(times), len(feature_names)))
+        features[:] = np.nan
+
+        if s in mappings['sample_to_idx']:
+            # (time, cell, modality, gene) -> (cell, time, modality * gene), filled one modality at a time
+            sample_tensor = tensor[mappings['sample_to_idx'][s]]
+            for m in range(len(modalities)):
+                block = np.asarray(sample_tensor[:, :, m, :], dtype=np.float32).transpose(1, 0, 2)
+                features[cell_pos[:, None], time_pos[None, :], m * n_genes:(m + 1) * n_genes] = block
+
+        for offset, df in enumerate(morphology[s]):
+            df_cells = np.searchsorted(cells, df.columns.to_numpy(dtype=str))
+            df_times = np.searchsorted(times, df.index.to_numpy(dtype=np.int64))
+            features[df_cells[:, None], df_times[None, :], n_expression + offset] = df.to_numpy(dtype=np.float32).T
+        features.flush()
+        del features
+
+        births = np.full(len(cells), np.iinfo(np.int64).max)
+        deaths = np.full(len(cells), np.iinfo(np.int64).min)
+        span_cells = np.searchsorted(cells, np.array(list(spans[s]), dtype=str))
+        births[span_cells] = [birth for birth, _ in spans[s].values()]
+        deaths[span_cells] = [death for _, death in spans[s].values()]
+        mask = (times[None, :] >= births[:, None]) & (times[None, :] <= deaths[:, None])
+        np.save(os.path.join(sample_dir, 'mask.npy'), mask)
+
+    meta = {
+        'samples': [int(s) for s in samples],
+        'cells': cells.tolist(),
+        'times': times.tolist(),
+        'features': feature_names,
+        'lineage_vocab': lineage_vocab,
+        'fate_vocab': fate_vocab,
+    }
+    with open(os.path.join(export_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+def load_export(export_dir=EXPORT_DIR):
+    """Metadata, memory-mapped per-sample arrays and the shared labels of an export"""
+    with open(os.path.join(export_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    arrays = {}
+    for s in meta['samples']:
+        sample_dir = os.path.join(export_dir, f'sample_{s}')
+        arrays[s] = (np.load(os.path.join(sample_dir, 'features.npy'), mmap_mode='r'),
+                     np.load(os.path.join(sample_dir, 'mask.npy'), mmap_mode='r'))
+    labels = {
+        'lineage': np.load(os.path.join(export_dir, 'lineage_labels.npy')),
+        'fate': np.load(os.path.join(export_dir, 'fate_labels.npy')),
+    }
+    return meta, arrays, labels
+
+def iter_batches(export_dir=EXPORT_DIR, samples=None, batch_size=64, shuffle=True, seed=0, present_only=True):
+    """Yield mini-batches of cells as dicts of arrays: features (batch, time, feature), mask
+    (batch, time), lineage and fate labels, and the sample and cell index of every row.
+    With ``present_only``, cells that are never alive in a sample are skipped."""
+    meta, arrays, labels = load_export(export_dir)
+    samples = meta['samples'] if samples is None else samples
+
+    # All (sample, cell) rows, selected with array operations rather than per record
+    row_samples = []
+    row_cells = []
+    for s in samples:
+        cell_idx = np.flatnonzero(arrays[s][1].any(axis=1)) if present_only else np.arange(len(meta['cells']))
+        row_samples.append(np.full(len(cell_idx), s))
+        row_cells.append(cell_idx)
+    row_samples = np.concatenate(row_samples)
+    row_cells = np.concatenate(row_cells)
+    order = np.random.default_rng(seed).permutation(len(row_cells)) if shuffle else np.arange(len(row_cells))
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch_samples = row_samples[batch]
+        batch_cells = row_cells[batch]
+        features = np.empty((len(batch),) + arrays[samples[0]][0].shape[1:], dtype=np.float32)
+        mask = np.empty((len(batch), len(meta['times'])), dtype=bool)
+        # One sorted gather per sample keeps memory-mapped reads sequential
+        for s in np.unique(batch_samples):
+            rows = np.flatnonzero(batch_samples == s)
+            rows = rows[np.argsort(batch_cells[rows])]
+            features[rows] = arrays[s][0][batch_cells[rows]]
+            mask[rows] = arrays[s][1][batch_cells[rows]]
+        yield {
+            'features': features,
+            'mask': mask,
+            'lineage': labels['lineage'][batch_cells],
+            'fate': labels['fate'][batch_cells],
+            'sample': batch_samples,
+            'cell': batch_cells,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Export per-cell feature matrices for ML training')
+    parser.add_argument('--samples', type=int, nargs='+')
+    parser.add_argument('--out', default=EXPORT_DIR)
+    args = parser.parse_args()
+    meta = export_features(samples=args.samples, export_dir=args.out)
+    print(f"Exported {len(meta['samples'])} samples: {len(meta['cells'])} cells x "
+          f"{len(meta['times'])} time points x {len(meta['features'])} features to {args.out}/")
+
+if __name__ == "__main__":
+    main()
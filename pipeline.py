@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import build_lineage_tree
+import create_tensor
+import create_json_alive
+import create_json_unborn
+import derived_signals
+import validate_inputs
+from instrumentation import StageRecorder
+from sample_inputs import CACHE_DIR
+
+STAGES = ('lineage', 'validate', 'tensor', 'derived', 'json_alive', 'json_unborn')
+
+REPORT_PATH = 'reports/pipeline_runs.jsonl'
+
+def run_pipeline(stages=STAGES, samples=range(1, 9), dtype='float64', recorder=None,
+                 data_dir='data', tensor_dir='tensor', json_dir='json', window=None,
+                 cache_dir=CACHE_DIR):
+    """Run the selected stages in order, timing each stage and each sample on ``recorder``.
+    The alive JSONs include derived signals when the derived stage ran or its channels exist. ``window``
+    is the smoothing window of the derived channels; if None, the derived stage uses DEFAULT_WINDOW and
+    the JSON stage keeps the window the channels were built with."""
+    if window is not None:
+        derived_signals.check_window(window)
+    recorder = recorder or StageRecorder()
+    additional_dir = os.path.join(data_dir, 'additional')
+    cell_fate_path = os.path.join(data_dir, 'Cell Fate.csv')
+
+    if 'lineage' in stages:
+        with recorder.stage('lineage'):
+            build_lineage_tree.build_lineage_tree(additional_dir)
+
+    # Fail before the long-running stages if the inputs are inconsistent
+    if 'validate' in stages:
+        with recorder.stage('validate'):
+            issues = validate_inputs.validate_inputs(data_dir, samples, cache_dir=cache_dir)
+        if issues:
+            raise ValueError(f"Input validation found {len(issues)} issues:\n{validate_inputs.format_issues(issues)}")
+
+    if 'tensor' in stages:
+        with recorder.stage('tensor'):
+            create_tensor.build_tensor(os.path.join(data_dir, 'raw'), tensor_dir, dtype=dtype, recorder=recorder)
+
+    if 'derived' in stages:
+        with recorder.stage('derived'):
+            window = derived_signals.DEFAULT_WINDOW if window is None else window
+            derived_signals.build_derived(tensor_dir, additional_dir, window=window, recorder=recorder,
+                                          cache_dir=cache_dir)
+    use_derived = derived_signals.has_derived(tensor_dir)
+
+    for name, builder in (('json_alive', create_json_alive), ('json_unborn', create_json_unborn)):
+        if name not in stages:
+            continue
+        os.makedirs(json_dir, exist_ok=True)
+        with recorder.stage(name):
+            with recorder.stage(f'{name}.load_context'):
+                if builder is create_json_alive:
+                    context = builder.load_context(tensor_dir, additional_dir, cell_fate_path, derived=use_derived,
+                                                   window=window, cache_dir=cache_dir)
+                else:
+                    context = builder.load_context(tensor_dir, additional_dir, cell_fate_path)
+            for sample_num in samples:
+                with recorder.stage(f'{name}.sample', sample=sample_num):
+                    builder.build_sample_json(sample_num, context, additional_dir, json_dir, recorder=recorder,
+                                              cache_dir=cache_dir)
+    return recorder
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the lineage, tensor and JSON stages with timing and memory report')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+    parser.add_argument('--samples', type=int, nargs='+', default=list(range(1, 9)))
+    parser.add_argument('--dtype', default='float64', choices=create_tensor.SUPPORTED_DTYPES)
+    parser.add_argument('--window', type=int,
+                        help=f'smoothing window of the derived channels in time points (derived stage default: '
+                             f'{derived_signals.DEFAULT_WINDOW}; JSON stages alone keep the built window)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='where parsed sample inputs are cached')
+    parser.add_argument('--report', default=REPORT_PATH, help='JSON lines file the run is appended to')
+    args = parser.parse_args()
+
+    recorder = StageRecorder()
+    try:
+        run_pipeline(args.stages, args.samples, args.dtype, recorder, window=args.window, cache_dir=args.cache_dir)
+    finally:
+        print("\nStage timings:")
+        print(recorder.summary())
+        recorder.write_report(args.report, argv=sys.argv[1:], stages_run=args.stages,
+                              samples=args.samples, dtype=args.dtype, window=args.window)
+        print(f"Report appended to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-import matplotlib.pyplot as plt
+import argparse
 import json
 import os
-import numpy as np
+from catalog import alive_json_path, load_catalog
 
 def get_valid_input(prompt, valid_values=None, value_type=str):
     while True:
@@ -13,26 +13,62 @@ def get_valid_input(prompt, valid_values=None, value_type=str):
         except ValueError:
             print(f"Please enter a valid {value_type.__name__}")
 
-def gather_all_cells(json_dir, n_samples=8):
-    all_cells = set()
+# Parsed sample JSONs keyed by (json_dir, sample_num), shared by the plot functions and plot_server
+_sample_cache = {}
+
+def load_sample(json_dir, sample_num):
+    """A sample's alive JSON, parsed once and reused until the file changes"""
+    json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
+    if not os.path.exists(json_path):
+        return None
+    mtime = os.path.getmtime(json_path)
+    cached = _sample_cache.get((json_dir, sample_num))
+    if cached is None or cached[0] != mtime:
+        with open(json_path, 'r') as f:
+            cached = (mtime, json.load(f))
+        _sample_cache[(json_dir, sample_num)] = cached
+    return cached[1]
+
+def catalog_samples(json_dir, n_samples=8):
+    """Catalog entries of the samples whose alive JSON they describe, and the samples whose
+    alive JSON has no entry or was rebuilt after it (these must be scanned)"""
+    catalog = load_catalog(json_dir) or {'samples': {}}
+    entries = {}
+    unlisted = []
     for sample_num in range(1, n_samples+1):
-        json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
+        json_path = alive_json_path(json_dir, sample_num)
         if not os.path.exists(json_path):
             continue
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        entry = catalog['samples'].get(str(sample_num))
+        if entry is None or os.path.getmtime(json_path) > entry.get('json_mtime', float('-inf')):
+            unlisted.append(sample_num)
+        else:
+            entries[sample_num] = entry
+    return entries, unlisted
+
+def gather_all_cells(json_dir, n_samples=8):
+    entries, unlisted = catalog_samples(json_dir, n_samples)
+    all_cells = {cell for entry in entries.values() for cell in entry['cells']}
+    for sample_num in unlisted:
+        data = load_sample(json_dir, sample_num)
+        if data is None:
+            continue
         all_cells.update(data.keys())
     return sorted(all_cells)
 
 def get_cell_specific_genes(cell, json_dir, n_samples=8):
     protein_genes = set()
     promoter_genes = set()
-    for sample_num in range(1, n_samples+1):
-        json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
-        if not os.path.exists(json_path):
+    entries, unlisted = catalog_samples(json_dir, n_samples)
+    for entry in entries.values():
+        if cell in entry['cells']:
+            protein_genes.update(entry['cells'][cell]['proteins'])
+            promoter_genes.update(entry['cells'][cell]['promoters'])
+
+    for sample_num in unlisted:
+        data = load_sample(json_dir, sample_num)
+        if data is None:
             continue
-        with open(json_path, 'r') as f:
-            data = json.load(f)
         if cell not in data:
             continue
         for t in data[cell]:
@@ -43,8 +79,99 @@ def get_cell_specific_genes(cell, json_dir, n_samples=8):
                 promoter_genes.update(entry['promoters'].keys())
     return sorted(protein_genes), sorted(promoter_genes)
 
-def plot_combined_across_samples(cell, modality, gene_name=None, json_dir='json', n_samples=8):
-    """Plot all samples on the same graph for surface area, volume, proteins, and promoters"""
+# Menu shortcut of each modality
+MODALITY_SHORTCUTS = {
+    'prot': 'Proteins Gene Expression Rate',
+    'prom': 'Promoters Gene Expression Rate',
+    'sa': 'Surface Area',
+    'v': 'Volume',
+    'ca': 'Contacting Area with Neighbours',
+    'protv': 'Proteins Expression Rate per Volume',
+    'promv': 'Promoters Expression Rate per Volume',
+    'prots': 'Smoothed Proteins Expression Rate',
+    'proms': 'Smoothed Promoters Expression Rate',
+    'sar': 'Surface Area Rate of Change',
+    'vr': 'Volume Rate of Change',
+}
+
+# JSON entry key holding each plottable modality
+MODALITY_KEYS = {
+    'Proteins Gene Expression Rate': 'proteins',
+    'Promoters Gene Expression Rate': 'promoters',
+    'Surface Area': 'surface_area',
+    'Volume': 'volume',
+    'Proteins Expression Rate per Volume': 'proteins_per_volume',
+    'Promoters Expression Rate per Volume': 'promoters_per_volume',
+    'Smoothed Proteins Expression Rate': 'proteins_smoothed',
+    'Smoothed Promoters Expression Rate': 'promoters_smoothed',
+    'Surface Area Rate of Change': 'surface_rate',
+    'Volume Rate of Change': 'volume_rate',
+}
+
+# Signals from derived_signals.py, found under each entry's "derived" key, with their axis label
+DERIVED_MODALITIES = {
+    'Proteins Expression Rate per Volume': 'Protein {gene} Expression Rate per Volume',
+    'Promoters Expression Rate per Volume': 'Promoter {gene} Expression Rate per Volume',
+    'Smoothed Proteins Expression Rate': 'Smoothed Protein {gene} Expression Rate',
+    'Smoothed Promoters Expression Rate': 'Smoothed Promoter {gene} Expression Rate',
+    'Surface Area Rate of Change': 'Surface Area Rate of Change',
+    'Volume Rate of Change': 'Volume Rate of Change',
+}
+
+# Per-gene modalities and the gene list ('proteins' or 'promoters') they are chosen from
+GENE_MODALITIES = {
+    'Proteins Gene Expression Rate': 'proteins',
+    'Promoters Gene Expression Rate': 'promoters',
+    'Proteins Expression Rate per Volume': 'proteins',
+    'Promoters Expression Rate per Volume': 'promoters',
+    'Smoothed Proteins Expression Rate': 'proteins',
+    'Smoothed Promoters Expression Rate': 'promoters',
+}
+
+def has_derived_signals(json_dir):
+    """Whether the sample JSONs were built with derived signals (assumed so without a catalog)"""
+    catalog = load_catalog(json_dir)
+    if catalog is None:
+        return True
+    return any(entry.get('derived', False) for entry in catalog['samples'].values())
+
+def extract_series(cell_data, modality, gene_name=None):
+    """Time points and values of one modality (and gene) from a cell's per-time-point entries"""
+    key = MODALITY_KEYS[modality]
+    plot_times = []
+    plot_values = []
+    for t in sorted(cell_data.keys(), key=lambda x: int(x)):
+        entry = cell_data[t]
+        if modality in DERIVED_MODALITIES:
+            entry = entry.get('derived', {})
+        if modality in GENE_MODALITIES:
+            val = entry.get(key, {}).get(gene_name, None)
+        else:
+            val = entry.get(key, None)
+        if val is not None:
+            plot_times.append(int(t))
+            plot_values.append(val)
+    return plot_times, plot_values
+
+def extract_contact_series(cell_data):
+    """Per neighbour, the time points and contacting areas of a cell"""
+    series = {}
+    for t in sorted(cell_data.keys(), key=lambda x: int(x)):
+        for neighbour, val in cell_data[t].get('contacting_area', {}).items():
+            times, values = series.setdefault(neighbour, ([], []))
+            times.append(int(t))
+            values.append(val)
+    return dict(sorted(series.items()))
+
+def plot_combined_across_samples(cell, modality, gene_name=None, json_dir='json', n_samples=8, alignment=None,
+                                 output=None, dpi=300):
+    """Plot all samples on the same graph for surface area, volume, proteins, and promoters.
+    If an alignment from time_alignment.py is given, times are mapped onto its common clock.
+    If output (a path or file object) is given, the PNG is written there instead of plots/."""
+    # Plotting libraries are imported on first use so listing cells and genes stays fast
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from time_alignment import align_times
     modality_folder_map = {
         'Proteins Gene Expression Rate': 'proteins',
         'Promoters Gene Expression Rate': 'promoters',
@@ -52,58 +179,29 @@ def plot_combined_across_samples(cell, modality, gene_name=None, json_dir='json'
         'Volume': 'volume',
         'Contacting Area with Neighbours': 'contacting_area',
     }
+    modality_folder_map.update({m: MODALITY_KEYS[m] for m in DERIVED_MODALITIES})
     
     folder = os.path.join('plots', modality_folder_map[modality])
-    os.makedirs(folder, exist_ok=True)
+    if output is None:
+        os.makedirs(folder, exist_ok=True)
     
     plt.figure(figsize=(12, 8))
     colors = plt.cm.tab10(np.linspace(0, 1, n_samples))
     
     for sample_num in range(1, n_samples+1):
-        json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
-        if not os.path.exists(json_path):
+        data = load_sample(json_dir, sample_num)
+        if data is None:
             print(f"Sample {sample_num}: JSON file not found, skipping.")
             continue
-        with open(json_path, 'r') as f:
-            data = json.load(f)
         if cell not in data:
             print(f"Sample {sample_num}: Cell '{cell}' not found, skipping.")
             continue
             
-        time_points = sorted(data[cell].keys(), key=lambda x: int(x))
-        plot_times = []
-        plot_values = []
+        plot_times, plot_values = extract_series(data[cell], modality, gene_name)
         
-        if modality == 'Proteins Gene Expression Rate':
-            for t in time_points:
-                entry = data[cell][t]
-                rate = entry['proteins'].get(gene_name, None)
-                if rate is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(rate)
-        elif modality == 'Promoters Gene Expression Rate':
-            for t in time_points:
-                entry = data[cell][t]
-                rate = entry['promoters'].get(gene_name, None)
-                if rate is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(rate)
-        elif modality == 'Surface Area':
-            for t in time_points:
-                entry = data[cell][t]
-                val = entry.get('surface_area', None)
-                if val is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(val)
-        elif modality == 'Volume':
-            for t in time_points:
-                entry = data[cell][t]
-                val = entry.get('volume', None)
-                if val is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(val)
-        
-        if plot_times:
+        if plot_times and alignment is not None:
+            plot_times = align_times(alignment, sample_num, plot_times)
+        if len(plot_times):
             plt.plot(plot_times, plot_values, marker='.', label=f'Sample {sample_num}', 
                     color=colors[sample_num-1], linewidth=2, markersize=6)
     
@@ -120,8 +218,11 @@ def plot_combined_across_samples(cell, modality, gene_name=None, json_dir='json'
     elif modality == 'Volume':
         y_label = "Volume"
         title = f"{y_label} in cell {cell} across all samples"
+    elif modality in DERIVED_MODALITIES:
+        y_label = DERIVED_MODALITIES[modality].format(gene=gene_name)
+        title = f"{y_label} in cell {cell} across all samples"
     
-    plt.xlabel('Time')
+    plt.xlabel('Time' if alignment is None else 'Aligned time (common developmental clock)')
     plt.ylabel(y_label)
     plt.title(title)
     plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
@@ -130,41 +231,43 @@ def plot_combined_across_samples(cell, modality, gene_name=None, json_dir='json'
     
     # Save plot
     plot_filename = f"{modality_folder_map[modality]}_cell_{cell}_combined"
+    if alignment is not None:
+        plot_filename += "_aligned"
     if gene_name:
         plot_filename += f"_{gene_name}"
     plot_filename += ".png"
+    if output is not None:
+        plt.savefig(output, format='png', bbox_inches='tight', dpi=dpi)
+        plt.close()
+        return
     plot_path = os.path.join(folder, plot_filename)
-    plt.savefig(plot_path, bbox_inches='tight', dpi=300)
+    plt.savefig(plot_path, bbox_inches='tight', dpi=dpi)
     plt.close()
     print(f"Combined plot saved to {plot_path}")
 
-def plot_contacting_area_group(cell, json_dir='json', n_samples=8):
+def plot_contacting_area_group(cell, json_dir='json', n_samples=8, output=None, dpi=300):
     """Create a group of plots for contacting area across all samples"""
+    # Plotting libraries are imported on first use so listing cells and genes stays fast
+    import matplotlib.pyplot as plt
+    import numpy as np
     folder = os.path.join('plots', 'contacting_area')
-    os.makedirs(folder, exist_ok=True)
+    if output is None:
+        os.makedirs(folder, exist_ok=True)
     
     fig, axes = plt.subplots(2, 4, figsize=(36, 16))
     axes = axes.flatten()
     
     for sample_num in range(1, n_samples+1):
-        json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
-        if not os.path.exists(json_path):
+        data = load_sample(json_dir, sample_num)
+        if data is None:
             print(f"Sample {sample_num}: JSON file not found, skipping.")
             continue
-        with open(json_path, 'r') as f:
-            data = json.load(f)
         if cell not in data:
             print(f"Sample {sample_num}: Cell '{cell}' not found, skipping.")
             continue
             
-        time_points = sorted(data[cell].keys(), key=lambda x: int(x))
-        all_neighbours = set()
-        
-        # Collect all neighbours
-        for t in time_points:
-            entry = data[cell][t]
-            contacting_area = entry.get('contacting_area', {})
-            all_neighbours.update(contacting_area.keys())
+        neighbour_series = extract_contact_series(data[cell])
+        all_neighbours = set(neighbour_series)
         
         if not all_neighbours:
             print(f"Sample {sample_num}: No contacting area data for cell '{cell}'.")
@@ -174,17 +277,7 @@ def plot_contacting_area_group(cell, json_dir='json', n_samples=8):
         ax = axes[sample_num-1]
         colors = plt.cm.tab10(np.linspace(0, 1, len(all_neighbours)))
         
-        for i, neighbour in enumerate(sorted(all_neighbours)):
-            neighbour_times = []
-            neighbour_values = []
-            for t in time_points:
-                entry = data[cell][t]
-                contacting_area = entry.get('contacting_area', {})
-                val = contacting_area.get(neighbour, None)
-                if val is not None:
-                    neighbour_times.append(int(t))
-                    neighbour_values.append(val)
-            
+        for i, (neighbour, (neighbour_times, neighbour_values)) in enumerate(neighbour_series.items()):
             if neighbour_times:
                 ax.plot(neighbour_times, neighbour_values, marker='.', 
                        label=neighbour, color=colors[i], linewidth=1, markersize=3)
@@ -207,70 +300,44 @@ def plot_contacting_area_group(cell, json_dir='json', n_samples=8):
     
     # Save plot
     plot_filename = f"contacting_area_cell_{cell}_group.png"
+    if output is not None:
+        plt.savefig(output, format='png', bbox_inches='tight', dpi=dpi)
+        plt.close()
+        return
     plot_path = os.path.join(folder, plot_filename)
-    plt.savefig(plot_path, bbox_inches='tight', dpi=300)
+    plt.savefig(plot_path, bbox_inches='tight', dpi=dpi)
     plt.close()
     print(f"Contacting area group plot saved to {plot_path}")
 
-def plot_modality_group(cell, modality, gene_name=None, json_dir='json', n_samples=8):
+def plot_modality_group(cell, modality, gene_name=None, json_dir='json', n_samples=8, output=None, dpi=300):
     """Create a group of plots for other modalities across all samples"""
+    # Plotting libraries are imported on first use so listing cells and genes stays fast
+    import matplotlib.pyplot as plt
     modality_folder_map = {
         'Proteins Gene Expression Rate': 'proteins',
         'Promoters Gene Expression Rate': 'promoters',
         'Surface Area': 'surface_area',
         'Volume': 'volume',
     }
+    modality_folder_map.update({m: MODALITY_KEYS[m] for m in DERIVED_MODALITIES})
     
     folder = os.path.join('plots', modality_folder_map[modality])
-    os.makedirs(folder, exist_ok=True)
+    if output is None:
+        os.makedirs(folder, exist_ok=True)
     
     fig, axes = plt.subplots(2, 4, figsize=(32, 12))
     axes = axes.flatten()
     
     for sample_num in range(1, n_samples+1):
-        json_path = os.path.join(json_dir, f"sample_{sample_num}_alive.json")
-        if not os.path.exists(json_path):
+        data = load_sample(json_dir, sample_num)
+        if data is None:
             print(f"Sample {sample_num}: JSON file not found, skipping.")
             continue
-        with open(json_path, 'r') as f:
-            data = json.load(f)
         if cell not in data:
             print(f"Sample {sample_num}: Cell '{cell}' not found, skipping.")
             continue
             
-        time_points = sorted(data[cell].keys(), key=lambda x: int(x))
-        plot_times = []
-        plot_values = []
-        
-        # Collect data for this sample
-        if modality == 'Proteins Gene Expression Rate':
-            for t in time_points:
-                entry = data[cell][t]
-                rate = entry['proteins'].get(gene_name, None)
-                if rate is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(rate)
-        elif modality == 'Promoters Gene Expression Rate':
-            for t in time_points:
-                entry = data[cell][t]
-                rate = entry['promoters'].get(gene_name, None)
-                if rate is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(rate)
-        elif modality == 'Surface Area':
-            for t in time_points:
-                entry = data[cell][t]
-                val = entry.get('surface_area', None)
-                if val is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(val)
-        elif modality == 'Volume':
-            for t in time_points:
-                entry = data[cell][t]
-                val = entry.get('volume', None)
-                if val is not None:
-                    plot_times.append(int(t))
-                    plot_values.append(val)
+        plot_times, plot_values = extract_series(data[cell], modality, gene_name)
         
         # Plot for this sample
         ax = axes[sample_num-1]
@@ -286,6 +353,8 @@ def plot_modality_group(cell, modality, gene_name=None, json_dir='json', n_sampl
             y_label = "Surface Area"
         elif modality == 'Volume':
             y_label = "Volume"
+        elif modality in DERIVED_MODALITIES:
+            y_label = DERIVED_MODALITIES[modality].format(gene=gene_name)
         
         ax.set_xlabel('Time')
         ax.set_ylabel(y_label)
@@ -305,6 +374,8 @@ def plot_modality_group(cell, modality, gene_name=None, json_dir='json', n_sampl
         title = f"Surface Area in cell {cell} across all samples"
     elif modality == 'Volume':
         title = f"Volume in cell {cell} across all samples"
+    elif modality in DERIVED_MODALITIES:
+        title = f"{DERIVED_MODALITIES[modality].format(gene=gene_name)} in cell {cell} across all samples"
     
     plt.suptitle(title, fontsize=16)
     plt.tight_layout()
@@ -314,26 +385,41 @@ def plot_modality_group(cell, modality, gene_name=None, json_dir='json', n_sampl
     if gene_name:
         plot_filename += f"_{gene_name}"
     plot_filename += ".png"
+    if output is not None:
+        plt.savefig(output, format='png', bbox_inches='tight', dpi=dpi)
+        plt.close()
+        return
     plot_path = os.path.join(folder, plot_filename)
-    plt.savefig(plot_path, bbox_inches='tight', dpi=300)
+    plt.savefig(plot_path, bbox_inches='tight', dpi=dpi)
     plt.close()
     print(f"Group plot saved to {plot_path}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Plot cell modalities from the sample JSON files')
+    parser.add_argument('--list-cells', action='store_true', help='print the available cells and exit')
+    parser.add_argument('--list-genes', metavar='CELL', help='print the protein and promoter genes of a cell and exit')
+    args = parser.parse_args()
     json_dir = 'json'
+
+    if args.list_cells:
+        print("\n".join(gather_all_cells(json_dir)))
+        return
+    if args.list_genes:
+        cell_proteins, cell_promoters = get_cell_specific_genes(args.list_genes, json_dir)
+        print(f"proteins: {', '.join(cell_proteins)}")
+        print(f"promoters: {', '.join(cell_promoters)}")
+        return
+
+    from time_alignment import load_alignment
+    alignment = load_alignment()
+    derived = has_derived_signals(json_dir)
     all_cells = gather_all_cells(json_dir)
     while True:
         print("\nAvailable cells:")
         print(", ".join(all_cells))
         cell = get_valid_input("Enter cell name: ", valid_values=all_cells)
         
-        modality_map = {
-            'prot': 'Proteins Gene Expression Rate',
-            'prom': 'Promoters Gene Expression Rate',
-            'sa': 'Surface Area',
-            'v': 'Volume',
-            'ca': 'Contacting Area with Neighbours',
-        }
+        modality_map = MODALITY_SHORTCUTS
         shortcuts = ['prot', 'prom', 'sa', 'v', 'ca']
         modalities = [
             'Proteins Gene Expression Rate',
@@ -342,6 +428,9 @@ def main():
             'Volume',
             'Contacting Area with Neighbours'
         ]
+        if derived:
+            shortcuts += [s for s, m in modality_map.items() if m in DERIVED_MODALITIES]
+            modalities += [modality_map[s] for s in shortcuts[5:]]
         print("\nAvailable modalities:")
         for m, s in zip(modalities, shortcuts):
             print(f"  {m} ({s})")
@@ -355,16 +444,20 @@ def main():
         else:
             print("  1. Combined plot (all samples on one graph)")
             print("  2. Group plot (subplots for each sample)")
-            plot_style = get_valid_input("Enter plot style (1/2): ", valid_values=['1', '2'])
+            if alignment is None:
+                plot_style = get_valid_input("Enter plot style (1/2): ", valid_values=['1', '2'])
+            else:
+                print("  3. Combined plot aligned to a common developmental clock")
+                plot_style = get_valid_input("Enter plot style (1/2/3): ", valid_values=['1', '2', '3'])
         gene_name = None
         
         # Only show genes present for the selected cell
         cell_proteins, cell_promoters = get_cell_specific_genes(cell, json_dir)
-        if modality == 'Proteins Gene Expression Rate':
+        if GENE_MODALITIES.get(modality) == 'proteins':
             print(f"\nAvailable protein genes for {cell}:")
             print(", ".join(cell_proteins))
             gene_name = get_valid_input("Enter protein gene name: ", valid_values=cell_proteins)
-        elif modality == 'Promoters Gene Expression Rate':
+        elif GENE_MODALITIES.get(modality) == 'promoters':
             print(f"\nAvailable promoter genes for {cell}:")
             print(", ".join(cell_promoters))
             gene_name = get_valid_input("Enter promoter gene name: ", valid_values=cell_promoters)
@@ -377,6 +470,8 @@ def main():
             # For other modalities, handle combined and group options
             if plot_style == '1':
                 plot_combined_across_samples(cell, modalities[shortcuts.index(modality_input)], gene_name, json_dir=json_dir)
+            elif plot_style == '3':
+                plot_combined_across_samples(cell, modalities[shortcuts.index(modality_input)], gene_name, json_dir=json_dir, alignment=alignment)
             elif plot_style == '2':
                 plot_modality_group(cell, modalities[shortcuts.index(modality_input)], gene_name, json_dir=json_dir)
         
@@ -0,0 +1,155 @@
+import argparse
+import io
+import json
+import os
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import plot_json
+from catalog import alive_json_path
+
+STYLES = ('combined', 'group', 'aligned')
+
+# Requested resolutions are clamped to this range; the contact area figure is 36x16 inches
+MIN_DPI = 1
+MAX_DPI = 300
+
+# pyplot keeps global state, so figures are rendered one at a time
+_render_lock = threading.Lock()
+
+class PlotServer:
+    """Series lookups and PNG rendering over plot_json's sample cache, which rereads a sample JSON
+    when it changes; rendered PNGs are cached per request key and JSON mtimes"""
+
+    def __init__(self, json_dir='json', n_samples=8, cache_size=512):
+        self.json_dir = json_dir
+        self.n_samples = n_samples
+        print("Loading sample data...")
+        loaded = sum(plot_json.load_sample(json_dir, s) is not None for s in range(1, n_samples + 1))
+        from time_alignment import load_alignment
+        self.alignment = load_alignment()
+        self.render = lru_cache(maxsize=cache_size)(self._render)
+        print(f"Loaded {loaded} samples, {len(self.cells())} cells")
+
+    def samples(self):
+        return {s: plot_json.load_sample(self.json_dir, s) for s in range(1, self.n_samples + 1)}
+
+    def cells(self):
+        return plot_json.gather_all_cells(self.json_dir, self.n_samples)
+
+    def json_mtimes(self):
+        """Part of the render cache key, so PNGs are redrawn after the sample JSONs are rebuilt"""
+        paths = [alive_json_path(self.json_dir, s) for s in range(1, self.n_samples + 1)]
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+
+    def genes(self, cell):
+        proteins, promoters = plot_json.get_cell_specific_genes(cell, self.json_dir, self.n_samples)
+        return {'proteins': proteins, 'promoters': promoters}
+
+    def series(self, cell, modality, gene_name=None):
+        """Per sample, the time series of a cell's modality (per neighbour for contacting area)"""
+        result = {}
+        for sample_num, data in self.samples().items():
+            if data is None or cell not in data:
+                continue
+            if modality == 'Contacting Area with Neighbours':
+                result[sample_num] = {neighbour: {'times': times, 'values': values} for neighbour, (times, values)
+                                      in plot_json.extract_contact_series(data[cell]).items()}
+            else:
+                times, values = plot_json.extract_series(data[cell], modality, gene_name)
+                if times and self.alignment is not None and sample_num in self.alignment['knots']:
+                    from time_alignment import align_times
+                    result[sample_num] = {'times': times, 'values': values,
+                                          'aligned_times': align_times(self.alignment, sample_num, times).tolist()}
+                else:
+                    result[sample_num] = {'times': times, 'values': values}
+        return result
+
+    def _render(self, cell, modality, gene_name, style, dpi, json_mtimes):
+        buffer = io.BytesIO()
+        kwargs = {'json_dir': self.json_dir, 'n_samples': self.n_samples, 'output': buffer, 'dpi': dpi}
+        with _render_lock:
+            if modality == 'Contacting Area with Neighbours':
+                plot_json.plot_contacting_area_group(cell, **kwargs)
+            elif style == 'group':
+                plot_json.plot_modality_group(cell, modality, gene_name, **kwargs)
+            else:
+                alignment = self.alignment if style == 'aligned' else None
+                plot_json.plot_combined_across_samples(cell, modality, gene_name, alignment=alignment, **kwargs)
+        return buffer.getvalue()
+
+def make_handler(server_state):
+    class Handler(BaseHTTPRequestHandler):
+        def send_body(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, payload, status=200):
+            self.send_body(status, 'application/json', json.dumps(payload).encode('utf-8'))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == '/cells':
+                    self.send_json(server_state.cells())
+                    return
+                if url.path not in ('/genes', '/series', '/plot.png'):
+                    self.send_json({'error': f'unknown path {url.path}'}, 404)
+                    return
+
+                cell = params.get('cell')
+                if cell not in server_state.cells():
+                    self.send_json({'error': f"unknown cell '{cell}'"}, 404)
+                    return
+                if url.path == '/genes':
+                    self.send_json(server_state.genes(cell))
+                    return
+
+                modality = plot_json.MODALITY_SHORTCUTS.get(params.get('modality'))
+                if modality is None:
+                    self.send_json({'error': f"modality must be one of {sorted(plot_json.MODALITY_SHORTCUTS)}"}, 400)
+                    return
+                gene_name = params.get('gene')
+                if modality in plot_json.GENE_MODALITIES and not gene_name:
+                    self.send_json({'error': 'gene is required for per-gene modalities'}, 400)
+                    return
+                if url.path == '/series':
+                    self.send_json(server_state.series(cell, modality, gene_name))
+                    return
+
+                style = params.get('style', 'combined')
+                if style not in STYLES or (style == 'aligned' and server_state.alignment is None):
+                    self.send_json({'error': f"style must be one of {STYLES} ('aligned' needs tensor/time_alignment.pkl)"}, 400)
+                    return
+                dpi = min(max(int(params.get('dpi', 100)), MIN_DPI), MAX_DPI)
+                self.send_body(200, 'image/png', server_state.render(cell, modality, gene_name, style, dpi,
+                                                                     server_state.json_mtimes()))
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 400)
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve cell time series and plots over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--json-dir', default='json')
+    args = parser.parse_args()
+
+    import matplotlib
+    matplotlib.use('Agg')
+    server_state = PlotServer(args.json_dir)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server_state))
+    print(f"Serving on http://{args.host}:{args.port}/ (endpoints: /cells, /genes, /series, /plot.png)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
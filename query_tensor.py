@@ -0,0 +1,149 @@
+import argparse
+import pickle
+import numpy as np
+import pandas as pd
+
+# Modality names accepted by the query functions, mapped to the tensor's modality labels
+MODALITY_ALIASES = {
+    'protein': 'Protein',
+    'proteins': 'Protein',
+    'promoter': 'Promoter',
+    'promoters': 'Promoter',
+}
+
+STATS = ('mean', 'median', 'count')
+
+def load_children_dict(children_path):
+    children_df = pd.read_csv(children_path)
+    children_dict = {}
+    for parent, child1, child2 in children_df[['parent', 'child1', 'child2']].itertuples(index=False):
+        children_dict[str(parent)] = [str(c) for c in (child1, child2) if pd.notna(c) and c]
+    return children_dict
+
+def load_cell_fates(cell_fate_path):
+    df = pd.read_csv(cell_fate_path)
+    cells = df['Cell identity'].astype(str).str.strip("'")
+    fates = df['Cell fate'].astype(str).str.strip("'")
+    lineages = df['Cell lineage'].astype(str).str.strip("'")
+    return dict(zip(cells, fates)), dict(zip(cells, lineages))
+
+def load_query_data(tensor_dir='tensor', additional_dir='data/additional', cell_fate_path='data/Cell Fate.csv'):
+    """Load the tensor (memory-mapped), its mappings and the lineage/fate tables once"""
+    tensor = np.load(f'{tensor_dir}/tensor.npy', mmap_mode='r')
+    with open(f'{tensor_dir}/mappings.pkl', 'rb') as f:
+        mappings = pickle.load(f)
+    cell_to_fate, cell_to_lineage = load_cell_fates(cell_fate_path)
+
+    idx_to_cell = np.empty(len(mappings['cell_to_idx']), dtype=object)
+    for cell, idx in mappings['cell_to_idx'].items():
+        idx_to_cell[idx] = cell
+    times = np.empty(len(mappings['time_to_idx']))
+    for t, idx in mappings['time_to_idx'].items():
+        times[idx] = t
+
+    return {
+        'tensor': tensor,
+        'mappings': mappings,
+        'times': times,
+        'idx_to_cell': idx_to_cell,
+        'children_dict': load_children_dict(f'{additional_dir}/lineage_tree_children.csv'),
+        'cell_to_fate': cell_to_fate,
+        'cell_to_lineage': cell_to_lineage,
+        'group_cache': {},
+    }
+
+def descendants(children_dict, root):
+    cells = []
+    stack = [root]
+    while stack:
+        cell = stack.pop()
+        cells.append(cell)
+        stack.extend(children_dict.get(cell, []))
+    return cells
+
+def cell_group_indices(data, root=None, fate=None, lineage=None):
+    """Tensor cell indices for a lineage subtree, a cell fate and/or a cell lineage, cached per (root, fate, lineage)"""
+    key = (root, fate, lineage)
+    if key in data['group_cache']:
+        return data['group_cache'][key]
+
+    cell_to_idx = data['mappings']['cell_to_idx']
+    mask = np.ones(len(cell_to_idx), dtype=bool)
+    if root is not None:
+        subtree = np.zeros(len(cell_to_idx), dtype=bool)
+        subtree[[cell_to_idx[c] for c in descendants(data['children_dict'], root) if c in cell_to_idx]] = True
+        mask &= subtree
+    if fate is not None:
+        fates = np.array([data['cell_to_fate'].get(c) for c in data['idx_to_cell']], dtype=object)
+        mask &= fates == fate
+    if lineage is not None:
+        lineages = np.array([data['cell_to_lineage'].get(c) for c in data['idx_to_cell']], dtype=object)
+        mask &= lineages == lineage
+
+    indices = np.flatnonzero(mask)
+    data['group_cache'][key] = indices
+    return indices
+
+def aggregate_expression(data, gene, modality, samples=None, root=None, fate=None, lineage=None, stats=STATS):
+    """Aggregate a gene's expression rate over a cell group, per sample and time point.
+
+    Returns a dict with the shared ``times`` axis and, per requested statistic, an array of
+    shape (n_samples, n_times). ``mean``/``median`` are NaN where no cell has data.
+    """
+    mappings = data['mappings']
+    modality = MODALITY_ALIASES.get(modality.lower(), modality)
+    if modality not in mappings['modality_to_idx']:
+        raise ValueError(f"Unknown modality '{modality}'")
+    if gene not in mappings['feature_to_idx']:
+        raise ValueError(f"Unknown gene '{gene}'")
+    for stat in stats:
+        if stat not in STATS:
+            raise ValueError(f"Unknown statistic '{stat}', choose from {STATS}")
+    if samples is None:
+        samples = sorted(mappings['sample_to_idx'])
+    sample_idx = [mappings['sample_to_idx'][s] for s in samples]
+    cell_idx = cell_group_indices(data, root=root, fate=fate, lineage=lineage)
+
+    # (sample, time, cell) slab for the selected group, upcast so reductions of
+    # reduced-precision tensors accumulate in float64
+    values = data['tensor'][:, :, :, mappings['modality_to_idx'][modality], mappings['feature_to_idx'][gene]]
+    values = np.asarray(values[sample_idx][:, :, cell_idx], dtype=np.float64)
+
+    count = np.sum(~np.isnan(values), axis=2)
+    result = {'samples': list(samples), 'times': data['times'], 'n_cells': len(cell_idx)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'mean' in stats:
+            result['mean'] = np.where(count > 0, np.nansum(values, axis=2) / count, np.nan)
+        if 'median' in stats:
+            median = np.full(count.shape, np.nan)
+            has_data = count > 0
+            if has_data.any():
+                median[has_data] = np.nanmedian(values[has_data], axis=1)
+            result['median'] = median
+    if 'count' in stats:
+        result['count'] = count
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate expression over a lineage subtree or cell fate')
+    parser.add_argument('gene')
+    parser.add_argument('modality', help='protein or promoter')
+    parser.add_argument('--root', help='lineage root cell, e.g. ABa')
+    parser.add_argument('--fate', help="cell fate from 'Cell Fate.csv'")
+    parser.add_argument('--lineage', help="cell lineage from 'Cell Fate.csv'")
+    parser.add_argument('--samples', type=int, nargs='+')
+    parser.add_argument('--stat', default='mean', choices=STATS)
+    args = parser.parse_args()
+
+    data = load_query_data()
+    result = aggregate_expression(data, args.gene, args.modality, samples=args.samples,
+                                  root=args.root, fate=args.fate, lineage=args.lineage, stats=(args.stat, 'count'))
+    print(f"{result['n_cells']} cells in group")
+    for i, sample_num in enumerate(result['samples']):
+        has_data = result['count'][i] > 0
+        print(f"\nSample {sample_num}:")
+        for t, value, n in zip(result['times'][has_data], result[args.stat][i][has_data], result['count'][i][has_data]):
+            print(f"  t={int(t)}: {value:.4g} (n={n})")
+
+if __name__ == "__main__":
+    main()
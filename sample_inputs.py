@@ -0,0 +1,96 @@
+import hashlib
+import io
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'cache/inputs'
+
+def sample_paths(sample_num, additional_dir='data/additional'):
+    sample_dir = f'{additional_dir}/WT_Sample{sample_num}'
+    return {
+        'lifecycle': f'{sample_dir}/WT_Sample{sample_num}_lifescycle.csv',
+        'surface': f'{sample_dir}/WT_Sample{sample_num}_surface.csv',
+        'volume': f'{sample_dir}/WT_Sample{sample_num}_volume.csv',
+        'stat': f'{sample_dir}/WT_Sample{sample_num}_Stat.csv',
+    }
+
+def read_lifecycle(path):
+    """Cell ids with their first and last alive time point from a ragged lifecycle file.
+
+    Each line is ``cell_id,t1,t2,...`` with a varying number of fields; the file is parsed in one
+    pandas call padded to the widest line, and births/deaths are taken from the NaN mask.
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    n_fields = max((line.count(',') for line in text.splitlines()), default=0) + 1
+    if n_fields < 2:
+        return np.array([], dtype=str), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    df = pd.read_csv(io.StringIO(text), header=None, names=range(n_fields), dtype={0: str},
+                     skip_blank_lines=True)
+    times = df.iloc[:, 1:].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(times)
+    keep = df[0].notna().to_numpy() & valid.any(axis=1)
+    times, valid = times[keep], valid[keep]
+    rows = np.arange(len(times))
+    first = valid.argmax(axis=1)
+    last = valid.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    return (df[0].to_numpy(dtype=str)[keep],
+            times[rows, first].astype(np.int64),
+            times[rows, last].astype(np.int64))
+
+def read_sample_inputs(paths):
+    """Read the lifecycle, surface, volume and Stat files of a sample concurrently"""
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        lifecycle = pool.submit(read_lifecycle, paths['lifecycle'])
+        surface = pool.submit(pd.read_csv, paths['surface'], index_col=0)
+        volume = pool.submit(pd.read_csv, paths['volume'], index_col=0)
+        stat = pool.submit(pd.read_csv, paths['stat'])
+        cell_ids, births, deaths = lifecycle.result()
+        return {
+            'cell_ids': cell_ids,
+            'births': births,
+            'deaths': deaths,
+            'surface': surface.result(),
+            'volume': volume.result(),
+            'stat': stat.result(),
+        }
+
+def cache_path(sample_num, additional_dir='data/additional', cache_dir=CACHE_DIR):
+    """Cache file of a sample; the resolved additional_dir is part of the name so datasets never share bundles"""
+    key = hashlib.sha1(os.path.realpath(additional_dir).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f'WT_Sample{sample_num}_{key}.pkl')
+
+def load_sample_inputs(sample_num, additional_dir='data/additional', cache_dir=CACHE_DIR):
+    """Parsed inputs of a sample, from the binary cache unless any of its CSVs changed.
+    Pass ``cache_dir=None`` to always parse the CSVs."""
+    paths = sample_paths(sample_num, additional_dir)
+    if cache_dir is None:
+        return read_sample_inputs(paths)
+
+    source = {}
+    for path in paths.values():
+        stat = os.stat(path)
+        source[os.path.realpath(path)] = (stat.st_mtime_ns, stat.st_size)
+    path = cache_path(sample_num, additional_dir, cache_dir)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['source'] == source:
+            return cached['inputs']
+
+    inputs = read_sample_inputs(paths)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to a temporary file and renamed, so a concurrent or interrupted run never sees half a pickle
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'source': source, 'inputs': inputs}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return inputs
+
+def lifecycle_spans(inputs, name_dict):
+    """Cell name -> (birth, death), in lifecycle file order; ids missing from name_dict keep their id"""
+    return {name_dict.get(str(cell_id), str(cell_id)): (int(birth), int(death))
+            for cell_id, birth, death in zip(inputs['cell_ids'], inputs['births'], inputs['deaths'])}
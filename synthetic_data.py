@@ -0,0 +1,210 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Scale presets: number of samples, division rounds after the founder cells, time points, genes
+SCALES = {
+    'small': {'n_samples': 2, 'n_divisions': 4, 'n_times': 60, 'n_genes': 5},
+    'medium': {'n_samples': 4, 'n_divisions': 6, 'n_times': 150, 'n_genes': 20},
+    'large': {'n_samples': 8, 'n_divisions': 8, 'n_times': 250, 'n_genes': 60},
+}
+
+# Early divisions whose children are not named by appending a/p, as listed in
+# lineage_tree_children_beginning.csv
+FOUNDER_DIVISIONS = [
+    ('P0', 'AB', 'P1'),
+    ('AB', 'ABa', 'ABp'),
+    ('P1', 'EMS', 'P2'),
+    ('EMS', 'MS', 'E'),
+    ('P2', 'C', 'P3'),
+    ('P3', 'D', 'P4'),
+    ('P4', 'Z2', 'Z3'),
+]
+
+FATES = ['Neuron', 'Skin', 'Muscle', 'Pharynx', 'Glia', 'Death']
+FOUNDER_FATES = {'E': 'Intestine', 'Z2': 'Germ cell', 'Z3': 'Germ cell'}
+
+def build_lineage(n_divisions):
+    """Parent, generation and founder of every cell in a synthetic lineage"""
+    cells = {'P0': {'parent': None, 'generation': 0, 'founder': 'P0'}}
+    for parent, child1, child2 in FOUNDER_DIVISIONS:
+        for child in (child1, child2):
+            founder = child if child in ('AB', 'MS', 'E', 'C', 'D', 'Z2', 'Z3') else cells[parent]['founder']
+            cells[child] = {'parent': parent, 'generation': cells[parent]['generation'] + 1, 'founder': founder}
+
+    leaves = ['ABa', 'ABp', 'MS', 'E', 'C', 'D']
+    for _ in range(n_divisions):
+        next_leaves = []
+        for cell in leaves:
+            for suffix in ('a', 'p'):
+                child = cell + suffix
+                cells[child] = {'parent': cell, 'generation': cells[cell]['generation'] + 1,
+                                'founder': cells[cell]['founder']}
+                next_leaves.append(child)
+        leaves = next_leaves
+    return cells
+
+def sample_lifecycles(cells, n_times, rng):
+    """Alive interval (birth, death) of every cell in one sample, with a per-sample speed"""
+    max_generation = max(info['generation'] for info in cells.values())
+    # Cell cycles lengthen by 15% per generation and the whole lineage fits in ~n_times
+    base_cycle = n_times / sum(1.15 ** g for g in range(max_generation + 1))
+    speed = rng.uniform(0.9, 1.1)
+    parents = {info['parent'] for info in cells.values()}
+
+    lifecycles = {}
+    for cell, info in cells.items():  # parents are always inserted before their children
+        if info['parent'] is None:
+            birth = 1
+        elif info['parent'] in lifecycles and lifecycles[info['parent']][2]:
+            birth = lifecycles[info['parent']][1] + 1
+        else:
+            continue
+        cycle = max(2, int(round(base_cycle * 1.15 ** info['generation'] * speed * rng.uniform(0.9, 1.1))))
+        if birth > n_times:
+            continue
+        death = birth + cycle - 1
+        divides = death < n_times and cell in parents
+        lifecycles[cell] = (birth, min(death, n_times), divides)
+    return {cell: (birth, death) for cell, (birth, death, _) in lifecycles.items()}
+
+def cell_positions(cells, rng):
+    """Fixed 3D position per cell; children sit on either side of their parent"""
+    positions = {}
+    for cell, info in cells.items():
+        if info['parent'] is None:
+            positions[cell] = np.zeros(3)
+            continue
+        direction = rng.normal(size=3)
+        direction /= np.linalg.norm(direction)
+        positions[cell] = positions[info['parent']] + direction * 10 * 0.8 ** info['generation']
+    return positions
+
+def write_contacts(path, lifecycles, positions, n_times, rng, k=5):
+    """Stat.csv with contacts between each alive cell and its k nearest alive cells"""
+    names = sorted(lifecycles)
+    births = np.array([lifecycles[c][0] for c in names])
+    deaths = np.array([lifecycles[c][1] for c in names])
+    coords = np.array([positions[c] for c in names])
+    # Fixed per-pair contact scale so areas vary smoothly over time
+    pair_scale = rng.uniform(5, 50, size=(len(names), len(names)))
+    contacts = []
+    for t in range(1, n_times + 1):
+        alive = np.flatnonzero((births <= t) & (deaths >= t))
+        if len(alive) < 2:
+            continue
+        diff = coords[alive, None, :] - coords[None, alive, :]
+        dist = np.sqrt((diff ** 2).sum(axis=2))
+        np.fill_diagonal(dist, np.inf)
+        n_neighbours = min(k, len(alive) - 1)
+        nearest = alive[np.argpartition(dist, n_neighbours - 1, axis=1)[:, :n_neighbours]]
+        source = np.repeat(alive, n_neighbours)
+        contacts.append(np.stack([np.full(len(source), t - 1), np.minimum(source, nearest.ravel()),
+                                  np.maximum(source, nearest.ravel())]))
+    t, a, b = np.concatenate(contacts, axis=1) if contacts else np.zeros((3, 0), dtype=int)
+    pairs, pair_row = np.unique(a * len(names) + b, return_inverse=True)
+    areas = np.full((len(pairs), n_times), np.nan)
+    areas[pair_row, t] = pair_scale[a, b] * (1 + 0.05 * np.sin((t + 1) / 5))
+    stat_df = pd.DataFrame(areas.round(3), columns=[str(t) for t in range(1, n_times + 1)])
+    stat_df.insert(0, 'cell2', [names[i] for i in pairs % len(names)])
+    stat_df.insert(0, 'cell1', [names[i] for i in pairs // len(names)])
+    stat_df.to_csv(path, index=False)
+
+def generate_dataset(root, n_samples, n_divisions, n_times, n_genes, seed=0):
+    """Write a synthetic data/ tree (raw expression files, lineage and per-sample morphology) under root"""
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(root, 'data', 'raw')
+    additional_dir = os.path.join(root, 'data', 'additional')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(additional_dir, exist_ok=True)
+
+    cells = build_lineage(n_divisions)
+    cell_ids = {cell: i + 1 for i, cell in enumerate(cells)}
+    pd.DataFrame({'id': list(cell_ids.values()), 'name': list(cell_ids)}).to_csv(
+        os.path.join(additional_dir, 'name_dictionary.csv'), index=False)
+    pd.DataFrame(FOUNDER_DIVISIONS, columns=['parent', 'child1', 'child2']).to_csv(
+        os.path.join(additional_dir, 'lineage_tree_children_beginning.csv'), index=False)
+
+    # Fates for terminal cells, quoted like the lab's Cell Fate.csv
+    parents = {info['parent'] for info in cells.values()}
+    leaves = [cell for cell in cells if cell not in parents]
+    pd.DataFrame({
+        'Cell identity': [f"'{cell}'" for cell in leaves],
+        'Cell lineage': [f"'{cells[cell]['founder']}'" for cell in leaves],
+        'Cell fate': [f"'{FOUNDER_FATES.get(cells[cell]['founder'], rng.choice(FATES))}'" for cell in leaves],
+    }).to_csv(os.path.join(root, 'data', 'Cell Fate.csv'), index=False)
+
+    positions = cell_positions(cells, rng)
+    # Each gene is expressed in the sublineage below one randomly chosen cell
+    lineage_path = {}
+    for cell, info in cells.items():
+        lineage_path[cell] = lineage_path.get(info['parent'], set()) | {cell}
+    genes = [f'gene-{i + 1}' for i in range(n_genes)]
+    gene_roots = rng.choice([c for c, info in cells.items() if info['generation'] <= 4], size=n_genes)
+
+    fileinfo_rows = []
+    time_index = np.arange(1, n_times + 1)
+    for sample_num in range(1, n_samples + 1):
+        sample_dir = os.path.join(additional_dir, f'WT_Sample{sample_num}')
+        os.makedirs(sample_dir, exist_ok=True)
+        lifecycles = sample_lifecycles(cells, n_times, rng)
+
+        with open(os.path.join(sample_dir, f'WT_Sample{sample_num}_lifescycle.csv'), 'w') as f:
+            for cell, (birth, death) in lifecycles.items():
+                f.write(','.join([str(cell_ids[cell])] + [str(t) for t in range(birth, death + 1)]) + '\n')
+
+        names = sorted(lifecycles)
+        volume = np.full((n_times, len(names)), np.nan)
+        for j, cell in enumerate(names):
+            birth, death = lifecycles[cell]
+            alive = np.arange(birth, death + 1)
+            growth = 1 + 0.5 * (alive - birth) / max(death - birth, 1)
+            volume[alive - 1, j] = 1000 * 0.5 ** cells[cell]['generation'] * growth * rng.uniform(0.9, 1.1)
+        surface = 4.84 * volume ** (2 / 3)
+        pd.DataFrame(volume.round(3), index=time_index, columns=names).to_csv(
+            os.path.join(sample_dir, f'WT_Sample{sample_num}_volume.csv'))
+        pd.DataFrame(surface.round(3), index=time_index, columns=names).to_csv(
+            os.path.join(sample_dir, f'WT_Sample{sample_num}_surface.csv'))
+        write_contacts(os.path.join(sample_dir, f'WT_Sample{sample_num}_Stat.csv'),
+                       lifecycles, positions, n_times, rng)
+
+        for gene_num, (gene, gene_root) in enumerate(zip(genes, gene_roots)):
+            expressing = [c for c in names if gene_root in lineage_path[c]]
+            if not expressing:
+                continue
+            rows_cell = []
+            rows_time = []
+            for cell in expressing:
+                birth, death = lifecycles[cell]
+                rows_cell.extend([cell] * (death - birth + 1))
+                rows_time.extend(range(birth, death + 1))
+            rows_time = np.array(rows_time)
+            for construct_num in (1, 2):
+                rates = np.abs(np.sin(rows_time / (10 + gene_num)) + rng.normal(0, 0.1, len(rows_time))) * 100
+                rates[rng.random(len(rates)) < 0.05] = np.nan
+                filename = f'WorkSpace_{gene_num + 1}_0_{construct_num}_{sample_num}.csv'
+                pd.DataFrame({
+                    'Table1': rows_cell,
+                    'Table2': rows_time,
+                    'Table3': rng.uniform(0, 1000, len(rows_time)).round(2),
+                    'Table4': rates.round(4),
+                }).to_csv(os.path.join(raw_dir, filename), index=False)
+                fileinfo_rows.append(f'{filename}\t{gene}')
+
+    with open(os.path.join(raw_dir, 'FileInfo.txt'), 'w', encoding='utf-8') as f:
+        f.write('Filename\tGene\n')
+        f.write('\n'.join(fileinfo_rows) + '\n')
+    return len(cells)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic pipeline inputs')
+    parser.add_argument('root', help='directory the data/ tree is written into')
+    parser.add_argument('--scale', default='small', choices=sorted(SCALES))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    n_cells = generate_dataset(args.root, seed=args.seed, **SCALES[args.scale])
+    print(f"Generated {args.scale} dataset with {n_cells} lineage cells in {args.root}/data")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from sample_inputs import CACHE_DIR, lifecycle_spans, load_sample_inputs
+
+ALIGNMENT_METHODS = ('linear', 'piecewise')
+
+def load_name_dict(name_dict_path='data/additional/name_dictionary.csv'):
+    df = pd.read_csv(name_dict_path, header=None)[1:]
+    return dict(zip(df[0].astype(str), df[1].astype(str)))
+
+def load_birth_times(sample_num, name_dict, additional_dir='data/additional', cache_dir=CACHE_DIR):
+    """First alive time point of every cell in a sample's lifecycle file"""
+    inputs = load_sample_inputs(sample_num, additional_dir, cache_dir=cache_dir)
+    return {cell: birth for cell, (birth, _) in lifecycle_spans(inputs, name_dict).items()}
+
+def warp_times(knots_x, knots_y, slope, times):
+    """Map sample times onto the reference clock; linear extrapolation beyond the knots"""
+    times = np.asarray(times, dtype=np.float64)
+    aligned = np.interp(times, knots_x, knots_y)
+    below = times < knots_x[0]
+    above = times > knots_x[-1]
+    aligned[below] = knots_y[0] + slope * (times[below] - knots_x[0])
+    aligned[above] = knots_y[-1] + slope * (times[above] - knots_x[-1])
+    return aligned
+
+def fit_warp(sample_births, reference_births, method='linear'):
+    """Fit the warp of one sample from paired birth times of the reference cells"""
+    slope, intercept = np.polyfit(sample_births, reference_births, 1)
+    if slope <= 0:
+        raise ValueError('Reference birth times do not increase with sample time')
+    if method == 'linear':
+        knots_x = np.array([sample_births.min(), sample_births.max()], dtype=np.float64)
+        return knots_x, slope * knots_x + intercept, slope
+
+    # Piecewise: average reference times sharing a sample time, then keep the warp monotonic
+    knots_x, inverse = np.unique(sample_births, return_inverse=True)
+    knots_y = np.bincount(inverse, weights=reference_births) / np.bincount(inverse)
+    knots_y = np.maximum.accumulate(knots_y)
+    return knots_x.astype(np.float64), knots_y, slope
+
+def build_alignment(tensor_times, samples, additional_dir='data/additional', reference_cells=None, method='linear',
+                    cache_dir=CACHE_DIR):
+    """Precompute per-sample warp tables and resampling indices onto a common clock.
+
+    Reference events are the birth times of ``reference_cells`` (by default every cell born
+    after the first time point in all samples). The reference clock of a cell is the median
+    of its birth times across samples.
+    """
+    if method not in ALIGNMENT_METHODS:
+        raise ValueError(f"Unknown alignment method '{method}', choose from {ALIGNMENT_METHODS}")
+    name_dict = load_name_dict(f'{additional_dir}/name_dictionary.csv')
+    births = {s: load_birth_times(s, name_dict, additional_dir, cache_dir) for s in samples}
+
+    if reference_cells is None:
+        # Cells present from the first time point have no observed birth event
+        shared = set.intersection(*(set(b) for b in births.values()))
+        first_times = {s: min(b.values()) for s, b in births.items()}
+        reference_cells = sorted(c for c in shared
+                                 if all(births[s][c] > first_times[s] for s in samples))
+    else:
+        missing = [c for c in reference_cells if any(c not in b for b in births.values())]
+        if missing:
+            raise ValueError(f"Reference cells missing from some samples: {missing}")
+    if len(reference_cells) < 2:
+        raise ValueError('At least two reference cells are needed to align samples')
+
+    # (sample, reference cell) birth times and the median reference clock
+    birth_matrix = np.array([[births[s][c] for c in reference_cells] for s in samples], dtype=np.float64)
+    reference_births = np.median(birth_matrix, axis=0)
+
+    tensor_times = np.sort(np.asarray(tensor_times, dtype=np.float64))
+    knots = {}
+    aligned_tensor_times = np.empty((len(samples), len(tensor_times)))
+    for i, s in enumerate(samples):
+        knots[s] = fit_warp(birth_matrix[i], reference_births, method)
+        aligned_tensor_times[i] = warp_times(*knots[s], tensor_times)
+
+    common_times = np.arange(np.floor(aligned_tensor_times.min()), np.ceil(aligned_tensor_times.max()) + 1)
+
+    # Linear interpolation weights from each sample's tensor time axis onto the common clock
+    n_times = len(tensor_times)
+    lo = np.empty((len(samples), len(common_times)), dtype=np.int64)
+    for i in range(len(samples)):
+        lo[i] = np.searchsorted(aligned_tensor_times[i], common_times, side='right') - 1
+    lo = np.clip(lo, 0, max(n_times - 2, 0))
+    hi = np.minimum(lo + 1, n_times - 1)
+    t_lo = np.take_along_axis(aligned_tensor_times, lo, axis=1)
+    t_hi = np.take_along_axis(aligned_tensor_times, hi, axis=1)
+    span = t_hi - t_lo
+    weight = np.divide(common_times - t_lo, span, out=np.zeros_like(span), where=span > 0)
+    valid = (common_times >= aligned_tensor_times[:, :1]) & (common_times <= aligned_tensor_times[:, -1:])
+
+    return {
+        'samples': list(samples),
+        'sample_to_row': {s: i for i, s in enumerate(samples)},
+        'method': method,
+        'reference_cells': list(reference_cells),
+        'reference_births': reference_births,
+        'knots': knots,
+        'tensor_times': tensor_times,
+        'aligned_tensor_times': aligned_tensor_times,
+        'common_times': common_times,
+        'lo': lo,
+        'hi': hi,
+        'weight': weight,
+        'valid': valid,
+    }
+
+def align_times(alignment, sample_num, times):
+    """Sample time points expressed on the common developmental clock"""
+    return warp_times(*alignment['knots'][sample_num], times)
+
+def resample_to_common(alignment, sample_num, values):
+    """Resample values on the tensor time axis (axis 0) onto the common clock.
+
+    Linear interpolation between the two neighbouring sample times; where one neighbour is NaN
+    (unborn or dead), the other is used if it is the nearer one, so alive spans only lose the
+    part of an interval that is closer to a missing point.
+    """
+    row = alignment['sample_to_row'][sample_num]
+    values = np.asarray(values, dtype=np.float64)
+    lo, hi, valid = alignment['lo'][row], alignment['hi'][row], alignment['valid'][row]
+    w = alignment['weight'][row].reshape((-1,) + (1,) * (values.ndim - 1))
+    before, after = values[lo], values[hi]
+    resampled = before * (1 - w) + after * w
+    nearer = np.where(w <= 0.5, before, after)
+    resampled = np.where(np.isnan(resampled), nearer, resampled)
+    resampled[~valid] = np.nan
+    return resampled
+
+def resample_samples(alignment, samples, values):
+    """Resample a (sample, time, ...) slab, e.g. a tensor slice, onto the common clock"""
+    return np.stack([resample_to_common(alignment, s, values[i]) for i, s in enumerate(samples)])
+
+def load_alignment(path='tensor/time_alignment.pkl'):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute cross-sample time alignment tables')
+    parser.add_argument('--method', default='linear', choices=ALIGNMENT_METHODS)
+    parser.add_argument('--reference-cells', nargs='+', help='cells whose birth events anchor the alignment')
+    args = parser.parse_args()
+
+    with open('tensor/mappings.pkl', 'rb') as f:
+        mappings = pickle.load(f)
+    samples = sorted(mappings['sample_to_idx'])
+    print("Building time alignment...")
+    alignment = build_alignment(list(mappings['time_to_idx']), samples,
+                                reference_cells=args.reference_cells, method=args.method)
+    with open('tensor/time_alignment.pkl', 'wb') as f:
+        pickle.dump(alignment, f)
+    print(f"Aligned {len(samples)} samples on {len(alignment['reference_cells'])} reference birth events")
+    for s in samples:
+        knots_x, knots_y, slope = alignment['knots'][s]
+        print(f"  Sample {s}: slope {slope:.3f}, t={knots_x[0]:g} -> {knots_y[0]:.1f}")
+    print("Saved tensor/time_alignment.pkl")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from create_json_alive import load_name_dict
+from create_tensor import CONSTRUCT_MODALITIES, FILENAME_PATTERN, build_filename_to_gene_map
+from sample_inputs import CACHE_DIR, lifecycle_spans, load_sample_inputs
+
+# Offending items listed per issue; the count always covers all of them
+MAX_EXAMPLES = 5
+
+def issue(check, items, sample=None, count=None):
+    return {'check': check, 'sample': sample, 'count': len(items) if count is None else count,
+            'examples': [str(item) for item in items[:MAX_EXAMPLES]]}
+
+def raw_file_issues(raw_dir='data/raw'):
+    """WorkSpace files create_tensor.py would skip or cannot map to a gene, and FileInfo.txt entries without a file"""
+    files = pd.Series(sorted(f for f in os.listdir(raw_dir) if f.endswith('.csv')), dtype=str)
+    filename_to_gene = build_filename_to_gene_map(os.path.join(raw_dir, 'FileInfo.txt'))
+    parts = files.str.extract(f'^{FILENAME_PATTERN}')
+    recognised = parts[0].notna().to_numpy()
+    constructs = pd.to_numeric(parts[2]).to_numpy()
+    known = recognised & np.isin(constructs, list(CONSTRUCT_MODALITIES))
+
+    files = files.to_numpy()
+    issues = [
+        issue('unrecognised raw file names', files[~recognised]),
+        issue(f'unknown construct numbers (expected {sorted(CONSTRUCT_MODALITIES)})', files[recognised & ~known]),
+        issue('raw files missing from FileInfo.txt', files[known & ~np.isin(files, list(filename_to_gene))]),
+        issue('FileInfo.txt entries without a raw file', np.setdiff1d(list(filename_to_gene), files)),
+    ]
+    return [i for i in issues if i['count']]
+
+def lineage_cells(additional_dir='data/additional'):
+    """Cells of the lineage tree, or of name_dictionary.csv (which the tree is built from) before it exists"""
+    parent_path = os.path.join(additional_dir, 'lineage_tree_parent.csv')
+    if not os.path.exists(parent_path):
+        return np.array(sorted(load_name_dict(additional_dir).values()), dtype=str)
+    parent_df = pd.read_csv(parent_path, dtype=str)
+    cells = pd.concat([parent_df['child'], parent_df['parent']]).dropna()
+    return np.unique(cells.to_numpy(dtype=str))
+
+def cell_spans(cells, names, births, deaths):
+    """Birth and death of each of ``cells``; cells without a lifecycle get an empty span"""
+    never_born = np.full(len(cells), np.iinfo(np.int64).max)
+    never_dead = np.full(len(cells), np.iinfo(np.int64).min)
+    if len(names) == 0:
+        return never_born, never_dead
+    sorter = np.argsort(names)
+    idx = sorter[np.clip(np.searchsorted(names, cells, sorter=sorter), 0, len(names) - 1)]
+    found = names[idx] == cells
+    return np.where(found, births[idx], never_born), np.where(found, deaths[idx], never_dead)
+
+def sample_issues(sample_num, additional_dir, name_dict, lineage, cache_dir=CACHE_DIR):
+    """Lifecycle, Stat, surface and volume inconsistencies of one sample"""
+    inputs = load_sample_inputs(sample_num, additional_dir, cache_dir=cache_dir)
+    spans = lifecycle_spans(inputs, name_dict)
+    names = np.array(list(spans), dtype=str)
+    births = np.array([birth for birth, _ in spans.values()], dtype=np.int64)
+    deaths = np.array([death for _, death in spans.values()], dtype=np.int64)
+
+    cell_ids = inputs['cell_ids'].astype(str)
+    issues = [issue('lifecycle ids missing from name_dictionary.csv',
+                    cell_ids[~np.isin(cell_ids, list(name_dict))], sample_num)]
+
+    stat = inputs['stat']
+    pairs = stat[['cell1', 'cell2']].to_numpy(dtype=str)
+    cells = np.union1d(names, pairs.ravel())
+    issues.append(issue('cells missing from the lineage tree', cells[~np.isin(cells, lineage)], sample_num))
+
+    # Contacts (area > 0) at time points where either cell is not alive
+    times = stat.columns[2:].astype(int).to_numpy()
+    present = stat.iloc[:, 2:].to_numpy(dtype=np.float64) > 0
+    outside = np.zeros(present.shape, dtype=bool)
+    for column in range(2):
+        birth, death = cell_spans(pairs[:, column], names, births, deaths)
+        outside |= present & ((times[None, :] < birth[:, None]) | (times[None, :] > death[:, None]))
+    rows, cols = np.nonzero(outside)
+    examples = [f'{pairs[r, 0]}-{pairs[r, 1]}@{times[c]}' for r, c in zip(rows[:MAX_EXAMPLES], cols[:MAX_EXAMPLES])]
+    issues.append(issue("contacts outside a cell's lifetime", examples, sample_num, count=len(rows)))
+
+    for key in ('surface', 'volume'):
+        df = inputs[key]
+        df_cells = df.columns.to_numpy(dtype=str)
+        df_times = df.index.to_numpy(dtype=np.int64)
+        birth, death = cell_spans(df_cells, names, births, deaths)
+        outside = df.notna().to_numpy() & ((df_times[:, None] < birth[None, :]) | (df_times[:, None] > death[None, :]))
+        rows, cols = np.nonzero(outside)
+        examples = [f'{df_cells[c]}@{df_times[r]}' for r, c in zip(rows[:MAX_EXAMPLES], cols[:MAX_EXAMPLES])]
+        issues.append(issue(f'{key} values outside the alive span', examples, sample_num, count=len(rows)))
+    return [i for i in issues if i['count']]
+
+def validate_inputs(data_dir='data', samples=range(1, 9), cache_dir=CACHE_DIR):
+    """All issues found in the raw files and in the additional data of ``samples``"""
+    additional_dir = os.path.join(data_dir, 'additional')
+    name_dict = load_name_dict(additional_dir)
+    lineage = lineage_cells(additional_dir)
+    issues = raw_file_issues(os.path.join(data_dir, 'raw'))
+    for sample_num in samples:
+        issues += sample_issues(sample_num, additional_dir, name_dict, lineage, cache_dir)
+    return issues
+
+def format_issues(issues):
+    lines = []
+    for i in issues:
+        where = '' if i['sample'] is None else f"sample {i['sample']}: "
+        lines.append(f"  {where}{i['check']}: {i['count']} (e.g. {', '.join(i['examples'])})")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check raw and additional inputs for consistency')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--samples', type=int, nargs='+', default=list(range(1, 9)))
+    args = parser.parse_args()
+    issues = validate_inputs(args.data_dir, args.samples)
+    if issues:
+        print(f"Found {len(issues)} issues:")
+        print(format_issues(issues))
+        sys.exit(1)
+    print("All inputs are consistent")
+
+if __name__ == "__main__":
+    main()